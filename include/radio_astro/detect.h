@@ -23,6 +23,7 @@
 
 #include <radio_astro/api.h>
 #include <gnuradio/block.h>
+#include <vector>
 
 namespace gr {
   namespace radio_astro {
@@ -38,10 +39,36 @@ namespace gr {
      * 2. Number of sigma to declare an event
      * 3. Bandwidth used to unwind the time of the event in circular buffer
      * 4. Estimated time it takes for sample to go from input of horn to block
-     * 5. Mode: 1: Monitor, just pass input data,
-     *          2: Detect events and repeatedly output the last event
+     * 5. Mode: 0: Monitor, just pass input data,
+     *          1 or 2: Detect events and repeatedly output the last event
+     *          3: Events only; output a vector only when an event is found
+     * 6. Number of samples captured before the event
+     * 7. Number of samples captured from the event onward
+     *    (if both are 0, the event is centered in a vector length capture)
+     * 8. Input type: 0: complex float, 1: complex int16 (sc16),
+     *          2: complex int8 (sc8).  Integer samples are searched
+     *          without conversion; only captures are converted to
+     *          complex float, unscaled.
+     * 9. Threads: with more than 1, magnitudes squared of large input
+     *          batches are found in parallel shards; detection is
+     *          unchanged.
+     * 10. Inputs: 1, or 2 for coincidence detection.  With two inputs,
+     *          such as two polarizations, an event in the first input
+     *          counts only if the second is also above threshold within
+     *          the coincidence window.  Output vectors hold the capture
+     *          of the first input followed by that of the second.
      * output:
-     * 1: Vector of complex I/Q samples
+     * 1: Vector of complex I/Q samples, pre + post samples long for
+     *    each input
+     * 2: Optional monitor records, 4 floats for each monitor interval:
+     *    RMS, peak amplitude, sample index of the peak from the start of
+     *    the interval, and the number of events found in the interval
+     * 3: Optional cleaned stream, complex vectors of vector length:
+     *    the input delayed by the post trigger samples, with impulses
+     *    blanked.  The monitor port must also be connected.
+     * stats: Optional message port; a dictionary of the samples,
+     *    events, rms, nsigma, threshold, last event mjd and
+     *    event_seconds, every stats interval.
      * Event is tagged with three floating point values:
      * 1. Modified Julian Date of Event
      * 2. Peak intensity
@@ -62,16 +89,159 @@ namespace gr {
        * class. radio_astro::detect::make is the public interface for
        * creating new instances.
        */
-      static sptr make(int vec_length, float dms, float f_obs, float bw, float t_int, int nt);
+      static sptr make(int vec_length, float dms, float f_obs, float bw, float t_int, int nt,
+		       int pre_trigger = 0, int post_trigger = 0,
+		       int input_type = 0, int nthreads = 1, int ninputs = 1);
 
       virtual void set_dms(float dms) = 0;  // This is the nsigma parameter
 
       virtual void set_vlen(int vec_length) = 0;  // This is the nsigma parameter
-      virtual void set_mode(int nt) = 0;  // Data stream (mode == 0) or event
+      virtual void set_mode(int nt) = 0;  // Data stream (mode == 0), event or events only (3)
 
       virtual void set_bw(float bw) = 0;
 
       virtual void set_freq(float f_obs) = 0;
+
+      /*!
+       * \brief Estimate the RMS from the last nwindow samples, updated
+       * every block, instead of once per circular buffer.  Events are
+       * searched from the first vector.  0 selects the whole buffer.
+       */
+      virtual void set_noise_window(int nwindow) = 0;
+
+      /*!
+       * \brief Estimated RMS used until the noise window has filled.
+       * 0 uses the samples received so far.
+       */
+      virtual void set_noise_rms(float rms0) = 0;
+
+      /*!
+       * \brief Group samples above threshold into bursts.  A burst ends
+       * after ngap samples below threshold and yields one event, tagged
+       * with PEAKINDEX, WIDTH, FLUENCE, START and STOP.
+       */
+      virtual void set_merge_gap(int ngap) = 0;
+
+      /*!
+       * \brief Number of samples after a burst before the next may start.
+       */
+      virtual void set_holdoff(int nholdoff) = 0;
+
+      /*!
+       * \brief MJD of the first input sample.  Event times count samples
+       * from this time, or from the last rx_time tag.  With 0 and no
+       * tags, the clock less t_int times the first sample.
+       */
+      virtual void set_start_time(double mjd) = 0;
+
+      /*!
+       * \brief Set the least severe message printed: 0 debug, 1 info
+       * (the default), 2 warnings, 3 errors only.  Messages are
+       * printed from a low priority thread, at most 20 per second
+       * from the work thread.
+       */
+      virtual void set_log_level(int level) = 0;
+
+      /*!
+       * \brief Search boxcar sums of 1, 2, 4, ... up to maxwidth
+       * samples (at most 256), each against its own noise level, in
+       * one pass.  Events are tagged BOXCAR with the best width.
+       * 1, the default, searches single samples only.
+       */
+      virtual void set_max_width(int maxwidth) = 0;
+
+      /*!
+       * \brief Classify events by a list of n sigma tiers (at most 8).
+       * Each event is tagged TIER with the number of tiers its
+       * significance reaches, so one block serves a sensitive log
+       * (TIER 0 and up) and a high significance archive.  Events are
+       * still found at the N sigma threshold.  An empty list removes
+       * the tag.
+       */
+      virtual void set_tiers(const std::vector<float> &tiers) = 0;
+
+      /*!
+       * \brief Set the number of input samples summarized by each
+       * record on the optional monitor port.  The interval is rounded
+       * up to whole input vectors; 0 gives one record per vector.
+       */
+      virtual void set_monitor_interval(int ninterval) = 0;
+
+      /*!
+       * \brief Keep a histogram of the magnitude squared of all
+       * samples, four bins per octave, decaying over a minute.
+       */
+      virtual void set_histogram(bool enable) = 0;
+
+      /*!
+       * \brief Adjust the n sigma threshold once a second so that
+       * samples cross it at about rate per second, from the histogram
+       * of the last 10/rate seconds.  0, the default, keeps the fixed
+       * N sigma threshold.
+       */
+      virtual void set_target_rate(float rate) = 0;
+
+      //! Histogram counts, in bins of magnitude squared
+      virtual std::vector<float> get_histogram() = 0;
+
+      //! Lower edge of each histogram bin, magnitude squared
+      virtual std::vector<float> get_histogram_edges() = 0;
+
+      /*!
+       * \brief Blank samples more than nsigma_blank times the RMS, on
+       * the cleaned stream port.  0, the default, blanks nothing.
+       */
+      virtual void set_blank_sigma(float nsigma_blank) = 0;
+
+      //! Set the samples also blanked on each side of an impulse
+      virtual void set_blank_guard(int nguard) = 0;
+
+      //! Fill blanked samples with noise at the RMS, rather than zeros
+      virtual void set_blank_noise(bool noise) = 0;
+
+      //! Number of samples blanked so far
+      virtual uint64_t get_blanked() = 0;
+
+      //! Number of samples found above the blanking threshold so far
+      virtual uint64_t get_impulses() = 0;
+
+      /*!
+       * \brief Set the most samples between coincident peaks in the
+       * two inputs; 0, the default, needs both in the same sample.
+       */
+      virtual void set_coincidence_window(int ncoinc) = 0;
+
+      /*!
+       * \brief Set the samples in each bin of a coarse first stage.
+       * Only where sums of bin powers could cross threshold does the
+       * full rate search run; events found are unchanged.  0, the
+       * default, searches every sample at full rate.
+       */
+      virtual void set_coarse_bin(int nbin) = 0;
+
+      //! Number of samples received so far
+      virtual uint64_t get_samples() = 0;
+
+      //! Number of events found so far
+      virtual uint64_t get_events() = 0;
+
+      //! Current RMS of the input samples
+      virtual float get_rms() = 0;
+
+      //! Current detection threshold, an amplitude: N sigma times RMS
+      virtual float get_threshold() = 0;
+
+      //! Modified Julian Date of the last event, 0 before the first
+      virtual double get_last_mjd() = 0;
+
+      //! Seconds spent filling and searching samples so far
+      virtual double get_event_seconds() = 0;
+
+      /*!
+       * \brief Publish the values above as a dictionary on the stats
+       * message port every interval seconds.  0, the default, never.
+       */
+      virtual void set_stats_interval(float seconds) = 0;
       
     };
 
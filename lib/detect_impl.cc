@@ -28,36 +28,147 @@
 #include "detect_impl.h"
 #include <iostream>
 #include <chrono>
+#include <string.h>
+#include <algorithm>
+#include <volk/volk.h>
+#include <boost/bind.hpp>
 
 namespace gr {
   namespace radio_astro {
 
     detect::sptr
-    detect::make(int vec_length, float dms, float f_obs, float bw, float t_int, int nt)
+    detect::make(int vec_length, float dms, float f_obs, float bw, float t_int, int nt,
+		 int pre_trigger, int post_trigger, int input_type, int nthreads,
+		 int ninputs)
     {
+      if (pre_trigger < 0)
+	pre_trigger = 0;
+      if (post_trigger < 0)
+	post_trigger = 0;
+      if (pre_trigger + post_trigger <= 0) // center event in one vector
+	{ pre_trigger = vec_length/2;
+	  post_trigger = vec_length - pre_trigger;
+	}
+      if ((input_type != INPUT_SC16) && (input_type != INPUT_SC8))
+	input_type = INPUT_FC32;
+      if (nthreads < 1)
+	nthreads = 1;
+      else if (nthreads > MAX_THREADS)
+	nthreads = MAX_THREADS;
+      ninputs = (ninputs > 1) ? 2 : 1;
       return gnuradio::get_initial_sptr
-        (new detect_impl(vec_length, dms, f_obs, bw, t_int, nt));
+        (new detect_impl(vec_length, dms, f_obs, bw, t_int, nt,
+			 pre_trigger, post_trigger, input_type, nthreads,
+			 ninputs));
     }
 
     /*
      * The private constructor
      */
-    detect_impl::detect_impl(int vec_length, float dms, float f_obs, float bw, float t_int, int nt)
+    detect_impl::detect_impl(int vec_length, float dms, float f_obs, float bw, float t_int, int nt,
+			     int pre_trigger, int post_trigger, int input_type,
+			     int nthreads, int ninputs)
       : gr::block("detect",
-		  gr::io_signature::make(1, 1, sizeof(gr_complex)*vec_length),
-		  gr::io_signature::make(1, 1, sizeof(gr_complex)*vec_length)),
+		  gr::io_signature::make(ninputs, ninputs, vec_length*
+					 (input_type == INPUT_SC16 ? 2*sizeof(int16_t) :
+					  input_type == INPUT_SC8 ? 2*sizeof(int8_t) :
+					  sizeof(gr_complex))),
+		  gr::io_signature::make3(1, 3, sizeof(gr_complex)*(pre_trigger+post_trigger)*ninputs,
+					  sizeof(float)*MONITOR_LEN,
+					  sizeof(gr_complex)*vec_length)),
         d_vec_length(vec_length),
         d_dms(dms),
         d_f_obs(f_obs),
         d_bw(bw),
         d_t_int(t_int),
-        d_nt(nt)
-    { set_vlen( vec_length);  /* initialize all imput values */
+        d_nt(nt),
+        d_pre(pre_trigger),
+        d_post(post_trigger),
+        d_itype(input_type),
+        d_ninputs(ninputs)
+    { long npage = 0;
+
+      if (d_itype == INPUT_SC16)
+	d_isize = 2*sizeof(int16_t);
+      else if (d_itype == INPUT_SC8)
+	d_isize = 2*sizeof(int8_t);
+      else
+	d_isize = sizeof(gr_complex);
+
+      /* the circular buffer holds one capture plus one block of samples,
+	 plus room for the widest boxcar, whose center can be half its
+	 width before the search start, rounded up to whole memory pages
+	 of the smaller ring */
+      npage = double_mapped_ring::pagesize()/std::min(long(sizeof(float)),
+						      long(d_isize));
+      d_ncapture = d_pre + d_post;
+      d_noutput = d_ninputs*d_ncapture;
+      d_nblock = (vec_length < MAX_BLOCK) ? vec_length : MAX_BLOCK;
+      if (d_nblock < 32)
+	d_nblock = 32;
+      d_nbuff = d_ncapture + d_nblock + MAX_BOXCAR;
+      d_nbuff = npage*((d_nbuff + npage - 1)/npage);
+      oneovern = 1./double(d_nbuff);
+      ring = new double_mapped_ring(d_nbuff*d_isize);
+      ring2 = new double_mapped_ring(d_nbuff*sizeof(float));
+      circular = (char *) ring->data();
+      circular2 = (float *) ring2->data();
+      samples = (gr_complex *) volk_malloc(d_noutput*sizeof(gr_complex),
+					   volk_get_alignment());
+      pending = (gr_complex *) volk_malloc(d_noutput*sizeof(gr_complex),
+					   volk_get_alignment());
+      memset(circular, 0, d_nbuff*d_isize);
+      std::fill(circular2, circular2 + d_nbuff, 0.);
+      std::fill(samples, samples + d_noutput, gr_complex(0., 0.));
+      std::fill(pending, pending + d_noutput, gr_complex(0., 0.));
+      if (d_ninputs > 1)       // second input, filled in lockstep
+	{ ringB = new double_mapped_ring(d_nbuff*d_isize);
+	  ring2B = new double_mapped_ring(d_nbuff*sizeof(float));
+	  circularB = (char *) ringB->data();
+	  circular2B = (float *) ring2B->data();
+	  memset(circularB, 0, d_nbuff*d_isize);
+	  std::fill(circular2B, circular2B + d_nbuff, 0.);
+	}
+      d_log = new log_ring();
+      d_log->setting("Input Capture: %d + %d samples\n", d_pre, d_post);
+      if (nthreads > 1)
+	{ d_pool = new shard_pool(nthreads - 1);
+	  d_log->setting("Input Threads: %d\n", nthreads);
+	  // large vectors get buffers of only a few items, too few samples
+	  // to shard; buffers hold at least two output multiples, so ask
+	  // for calls of at least MIN_SHARD samples
+	  set_output_multiple(std::max(1L, (MIN_SHARD + vec_length - 1)/
+				       vec_length));
+	}
+      if (d_ninputs > 1)
+	d_log->setting("Input Inputs: %d, events must be in both\n", d_ninputs);
+      if (d_itype == INPUT_SC16)
+	d_log->setting("Input Type: Complex int16\n");
+      else if (d_itype == INPUT_SC8)
+	d_log->setting("Input Type: Complex int8\n");
+
+      set_vlen( vec_length);  /* initialize all imput values */
       set_mode( nt);
       set_dms( dms);
       set_bw( bw);
       set_freq( f_obs);
       set_dt( t_int);
+      set_noise_window( 0);
+      set_noise_rms( 0.);
+      set_merge_gap( 0);
+      set_holdoff( 0);
+      set_max_width( 1);
+      set_monitor_interval( 0);
+      set_blank_sigma( 0.);
+      set_blank_guard( 0);
+      set_blank_noise( false);
+      set_coincidence_window( 0);
+      set_coarse_bin( 0);
+      message_port_register_out(pmt::mp("stats"));
+      set_stats_interval( 0.);
+      std::fill(d_hcount, d_hcount + HIST_BINS, 0);
+      std::fill(d_hist, d_hist + HIST_BINS, 0.);
+      set_start_time( 0.);
     }
 
     /*
@@ -65,6 +176,15 @@ namespace gr {
      */
     detect_impl::~detect_impl()
     {
+      delete ring;
+      delete ring2;
+      delete ringB;
+      delete ring2B;
+      volk_free(samples);
+      volk_free(pending);
+      volk_free(d_power);
+      delete d_pool;
+      delete d_log;
     }
 
     int
@@ -134,6 +254,52 @@ namespace gr {
       return mjd;
     } // end of get_mjd()
 
+    void
+    detect_impl::set_time(int day, double seconds, long long isample)
+    {
+      d_day0 = day;
+      d_sec0 = seconds;
+      d_sample0 = isample;
+      d_timed = true;
+    } // end of set_time()
+
+    void
+    detect_impl::set_time_now()
+    { double now = get_mjd() - (d_t_int/86400.);
+      int day = int(now);
+
+      // the next sample to arrive was at the horn t_int seconds ago
+      set_time(day, (now - day)*86400., d_nscan + d_post);
+    } // end of set_time_now()
+
+    void
+    detect_impl::set_time_tag(const gr::tag_t &tag)
+    { uint64_t secs = 0;
+      double frac = 0;
+
+      // rx_time is (whole seconds, fractional seconds) since 1970 Jan 1
+      if (! pmt::is_tuple(tag.value))
+	return;
+      secs = pmt::to_uint64(pmt::tuple_ref(tag.value, 0));
+      frac = pmt::to_double(pmt::tuple_ref(tag.value, 1));
+      set_time(int(MJD_UNIX_EPOCH + (secs/86400)),
+	       double(secs % 86400) + frac,
+	       (long long)(tag.offset)*d_vec_length);
+      d_tagged = true;
+    } // end of set_time_tag()
+
+    double
+    detect_impl::sample_mjd(long long isample)
+    { double seconds = d_sec0 + (double(isample - d_sample0)/d_rate);
+      int day = d_day0;
+      long nday = long(floor(seconds/86400.));
+
+      // keep whole days as integers, so seconds keep full precision
+      day += nday;
+      seconds -= nday*86400.;
+      return day + (seconds/86400.);
+    } // end of sample_mjd()
+
     void
     detect_impl::forecast (int noutput_items, gr_vector_int &ninput_items_required)
     {
@@ -147,45 +313,312 @@ namespace gr {
     detect_impl::set_dms ( float dms)
     {
       nsigma = dms;
-      printf("Input N Sigma: %7.1f\n", nsigma);
+      d_log->setting("Input N Sigma: %7.1f\n", nsigma);
       d_dms = dms;
+      nsigma_rms = nsigma*nsigma*rms2;
+      set_box_thresholds();
     }
 
+    void 
+    detect_impl::set_noise_window ( int nwindow)
+    {
+      if (nwindow <= 0)
+	{ nwindow = 0;
+	  d_log->setting("Input Noise Window: Buffer (%ld samples)\n", d_nbuff);
+	}
+      else if (nwindow > d_nbuff - d_nblock)
+	{ nwindow = d_nbuff - d_nblock;
+	  d_log->setting("Noise Window too large, using %d\n", nwindow);
+	}
+      else
+	d_log->setting("Input Noise Window: %d samples\n", nwindow);
+      d_nwindow = nwindow;
+      wsum2 = 0;             // restart the window sum
+      wcount = 0;
+      if (d_nwindow > 0)     // running window, search from the start
+	bufferfull = true;
+    } // end of set_noise_window()
+
+    void 
+    detect_impl::set_noise_rms ( float rms0)
+    {
+      if (rms0 < 0.)
+	rms0 = 0.;
+      d_rms0 = rms0;
+      d_log->setting("Input Noise RMS: %10.6f\n", d_rms0);
+      if (d_rms0 > 0.)       // start searching with the estimated rms
+	{ rms = d_rms0;
+	  rms2 = rms*rms;
+	  nsigma_rms = nsigma*nsigma*rms2;
+	  bufferfull = true;
+	}
+    } // end of set_noise_rms()
+
+    void 
+    detect_impl::set_start_time ( double mjd)
+    {
+      if (mjd > 0.)           // time of the first sample
+	{ set_time(int(mjd), (mjd - int(mjd))*86400., 0);
+	  d_log->setting("Input Start Time: %15.9f (MJD)\n", mjd);
+	}
+      else if (! d_tagged)    // time from the clock at the next call
+	d_timed = false;
+    } // end of set_start_time()
+
+    void 
+    detect_impl::set_merge_gap ( int ngap)
+    {
+      if (ngap < 0)
+	ngap = 0;
+      else if (ngap > d_nblock)
+	{ ngap = d_nblock;
+	  d_log->setting("Merge Gap too large, using %d\n", ngap);
+	}
+      d_ngap = ngap;
+      inburst = false;        // drop any burst in progress
+      d_log->setting("Input Merge Gap: %d samples\n", d_ngap);
+    } // end of set_merge_gap()
+
+    void 
+    detect_impl::set_holdoff ( int nholdoff)
+    {
+      if (nholdoff < 0)
+	nholdoff = 0;
+      d_nholdoff = nholdoff;
+      inburst = false;        // drop any burst in progress
+      bholdoff = 0;
+      d_log->setting("Input Hold Off: %d samples\n", d_nholdoff);
+    } // end of set_holdoff()
+
+    void 
+    detect_impl::set_tiers ( const std::vector<float> &tiers)
+    { int ntiers = 0;
+      float sorted[MAX_TIERS];
+
+      for (unsigned i = 0; (i < tiers.size()) && (ntiers < MAX_TIERS); i++)
+	{ if (tiers[i] > 0.)
+	    sorted[ntiers++] = tiers[i];
+	}
+      if (tiers.size() > MAX_TIERS)
+	d_log->setting("Too many Sigma Tiers, using the first %d\n", MAX_TIERS);
+      std::sort(sorted, sorted + ntiers);
+      d_ntiers = 0;           // no tiers while they are copied
+      for (int i = 0; i < ntiers; i++)
+	{ d_tiers[i] = sorted[i];
+	  d_log->setting("Input Sigma Tier %d: %7.1f\n", i + 1, d_tiers[i]);
+	}
+      d_ntiers = ntiers;
+    } // end of set_tiers()
+
+    void 
+    detect_impl::set_monitor_interval ( int ninterval)
+    {
+      // whole input vectors, at least one
+      d_monvectors = (ninterval + d_vec_length - 1)/d_vec_length;
+      if (d_monvectors < 1)
+	d_monvectors = 1;
+      d_log->setting("Input Monitor Interval: %ld samples\n",
+		     long(d_monvectors)*d_vec_length);
+    } // end of set_monitor_interval()
+
+    void 
+    detect_impl::set_histogram ( bool enable)
+    {
+      d_histogram = enable;
+      d_log->setting("Input Histogram: %s\n", enable ? "On" : "Off");
+    } // end of set_histogram()
+
+    void 
+    detect_impl::set_target_rate ( float rate)
+    {
+      if (rate <= 0.)
+	{ d_target = 0.;
+	  d_log->setting("Input Target Rate: Off\n");
+	  set_dms( d_dms);     // back to the fixed threshold
+	}
+      else
+	{ d_target = rate;
+	  d_log->setting("Input Target Rate: %10.6f events/s\n", d_target);
+	}
+    } // end of set_target_rate()
+
+    void 
+    detect_impl::set_blank_sigma ( float nsigma_blank)
+    {
+      if (nsigma_blank < 0.)
+	nsigma_blank = 0.;
+      d_blank2 = nsigma_blank*nsigma_blank;
+      if (nsigma_blank > 0.)
+	d_log->setting("Input Blank N Sigma: %7.1f\n", nsigma_blank);
+      else
+	d_log->setting("Input Blank N Sigma: Off\n");
+    } // end of set_blank_sigma()
+
+    void 
+    detect_impl::set_blank_guard ( int nguard)
+    { long limit = std::min(long(d_post), history());
+
+      // the guard after an impulse must already be in the buffer, and
+      // the guard before it not yet overwritten
+      if (nguard < 0)
+	nguard = 0;
+      else if (nguard > limit)
+	{ nguard = limit;
+	  d_log->setting("Blank Guard too large, using %d\n", nguard);
+	}
+      d_nguard = nguard;
+      update_lookback();
+      d_log->setting("Input Blank Guard: %d samples\n", d_nguard);
+    } // end of set_blank_guard()
+
+    void 
+    detect_impl::set_blank_noise ( bool noise)
+    {
+      d_blank_noise = noise;
+      d_log->setting("Input Blank Fill: %s\n", noise ? "Noise" : "Zeros");
+    } // end of set_blank_noise()
+
+    void 
+    detect_impl::set_coincidence_window ( int ncoinc)
+    { long limit = std::min(long(d_post), history() - MAX_BOXCAR/2);
+
+      // the window is read around a boxcar center, which can be half
+      // the widest boxcar before the search start
+      if (ncoinc < 0)
+	ncoinc = 0;
+      else if (ncoinc > limit)
+	{ ncoinc = limit;
+	  d_log->setting("Coincidence Window too large, using %d\n", ncoinc);
+	}
+      d_ncoinc = ncoinc;
+      update_lookback();
+      if (d_ninputs > 1)
+	d_log->setting("Input Coincidence Window: %d samples\n", d_ncoinc);
+    } // end of set_coincidence_window()
+
+    void
+    detect_impl::update_lookback()
+    { int nbox = (d_nwidths > 1) ? d_maxwidth : 0;
+
+      // boxcars, the blanking guard and the coincidence window around
+      // a boxcar center all read back before the search start
+      d_lookback = std::max(std::max(nbox, d_nguard), d_ncoinc + nbox/2);
+    } // end of update_lookback()
+
+    void 
+    detect_impl::set_coarse_bin ( int nbin)
+    {
+      if (nbin < 2)           // a bin of one sample is the full search
+	nbin = 0;
+      else if (nbin > d_nblock)
+	nbin = d_nblock;
+      d_nbin = nbin;
+      if (d_nbin > 0)
+	d_log->setting("Input Coarse Bin: %d samples\n", d_nbin);
+      else
+	d_log->setting("Input Coarse Bin: none, full rate search\n");
+    } // end of set_coarse_bin()
+
+    void 
+    detect_impl::set_stats_interval ( float seconds)
+    {
+      if (seconds < 0.)
+	seconds = 0.;
+      d_stats_interval = seconds;
+      d_stats_last = std::chrono::steady_clock::now();
+      if (d_stats_interval > 0.)
+	d_log->setting("Input Stats Interval: %7.2f s\n", d_stats_interval);
+    } // end of set_stats_interval()
+
+    void
+    detect_impl::publish_stats()
+    { pmt::pmt_t stats = pmt::make_dict();
+
+      stats = pmt::dict_add(stats, pmt::mp("samples"),
+			    pmt::from_uint64(get_samples()));
+      stats = pmt::dict_add(stats, pmt::mp("events"),
+			    pmt::from_uint64(d_nevents));
+      stats = pmt::dict_add(stats, pmt::mp("rms"), pmt::from_double(rms));
+      stats = pmt::dict_add(stats, pmt::mp("nsigma"),
+			    pmt::from_double(nsigma));
+      stats = pmt::dict_add(stats, pmt::mp("threshold"),
+			    pmt::from_double(get_threshold()));
+      stats = pmt::dict_add(stats, pmt::mp("mjd"),
+			    pmt::from_double(d_lastmjd));
+      stats = pmt::dict_add(stats, pmt::mp("event_seconds"),
+			    pmt::from_double(d_event_seconds));
+      message_port_pub(pmt::mp("stats"), stats);
+    } // end of publish_stats()
+
+    void 
+    detect_impl::set_log_level ( int level)
+    {
+      d_log->set_level(level);
+    } // end of set_log_level()
+
+    void 
+    detect_impl::set_max_width ( int maxwidth)
+    { int nwidths = 1;
+
+      // widths double from 1 sample; the buffer has room behind the
+      // search for the widest boxcar
+      while ((nwidths < MAX_WIDTHS) && ((1 << nwidths) <= maxwidth))
+	nwidths++;
+      d_nwidths = nwidths;
+      d_maxwidth = 1 << (nwidths - 1);
+      update_lookback();
+      d_boxwidth = 1;
+      inburst = false;        // drop any burst in progress
+      if (d_maxwidth < maxwidth)
+	d_log->setting("Boxcar Width too large, using %d\n", d_maxwidth);
+      d_log->setting("Input Boxcar Widths: 1 to %d samples\n", d_maxwidth);
+    } // end of set_max_width()
+
     void 
     detect_impl::set_dt ( float dt)
     {
       d_t_int = dt;
-      printf("Input Sample Delay: %15.9f s\n", d_t_int);
+      d_log->setting("Input Sample Delay: %15.9f s\n", d_t_int);
     }
       
     void 
     detect_impl::set_bw ( float bw)
     {
       if (bw < 0.01)
-	{printf("Input Bandwidth too small: %10.6f (MHz)\n", bw);
+	{d_log->setting("Input Bandwidth too small: %10.6f (MHz)\n", bw);
 	 bw = 1.0;
 	}
+      // restart the sample clock at the current sample, at the old rate
+      if (d_timed)
+	{ long long isample = d_nscan + d_post;
+	  double mjd = sample_mjd(isample);
+	  set_time(int(mjd), (mjd - int(mjd))*86400., isample);
+	}
       d_bw = bw;
+      d_rate = 1.E6*bw;
       
-      printf("Input Bandwidth: %7.1f (MHz)\n", bw);
-      bufferdelay = float(MAX_VLEN/2)*1.E-6/d_bw;
+      d_log->setting("Input Bandwidth: %7.1f (MHz)\n", bw);
+      bufferdelay = float(d_post)*1.E-6/d_bw;
     }
       
     void 
     detect_impl::set_freq ( float freq)
     {
       d_f_obs = freq;
-      printf("Input Frequency: %7.1f (MHz)\n", d_f_obs);
+      d_log->setting("Input Frequency: %7.1f (MHz)\n", d_f_obs);
     }
       
     void 
     detect_impl::set_mode ( int nt)
     {
-      if (nt == 0){
-	printf("Input Mode: Monitor\n");
+      if (nt == MODE_MONITOR){
+	d_log->setting("Input Mode: Monitor\n");
+      }
+      else if (nt == MODE_EVENTS){
+	d_log->setting("Input Mode: Events only\n");
       }
       else {
-	printf("Input Mode: Detect\n");
+	d_log->setting("Input Mode: Detect\n");
       }
 	
       d_nt = nt;
@@ -196,20 +629,19 @@ namespace gr {
     { vlen = invlen;
       if (vlen < 32) 
 	{ vlen = 32;
-	    printf("Vector Length too short, using %5d\n", vlen);
-	}
-      else if (vlen > MAX_VLEN) 
-	{ vlen = MAX_VLEN;
-	    printf("Vector Length too large, using %5d\n", vlen);
+	    d_log->setting("Vector Length too short, using %5d\n", vlen);
 	}
       d_vec_length = vlen;
-      vlen2 = vlen/2;
       
-      // vectors do not yet work;  circular = std::vector<gr_complex>(vlen);
       // now must initialize indicies
       inext = 0;
-      bufferfull = false;
-      inext2 = (MAX_BUFF/2) + 1;
+      bufferfull = (d_nwindow > 0);
+      inext2 = 0;
+      wsum2 = 0;
+      wcount = 0;
+      d_nscan = -d_post;      // first sample searched is post samples back
+      inburst = false;
+      bholdoff = 0;
     } // end of set_vlen()
       
     int
@@ -218,159 +650,869 @@ namespace gr {
                        gr_vector_const_void_star &input_items,
                        gr_vector_void_star &output_items)
     {
-      const gr_complex *in = (const gr_complex *) input_items[0];
+      const char *in = (const char *) input_items[0];
+      const char *inB = (d_ninputs > 1) ? (const char *) input_items[1] : NULL;
       gr_complex *out = (gr_complex *) output_items[0];
-      unsigned ninputs = ninput_items.size();
-      int success;
 
-      success = event(in, out);
+      // the monitor port is optional
+      d_monitor = (output_items.size() > 1) ? (float *) output_items[1] : NULL;
+      d_nmon = 0;
+      // so is the cleaned stream, after the monitor port
+      d_clean = (output_items.size() > 2) ?
+	(gr_complex *) output_items[2] : NULL;
+
+      int nin = 0, nout = 0;
+      std::vector<gr::tag_t> tags;
+
+      // event times count samples from the last rx_time tag, the start
+      // time, or the clock at the first call
+      get_tags_in_range(tags, 0, nitems_read(0),
+			nitems_read(0) + noutput_items, pmt::mp("rx_time"));
+      if (! tags.empty())
+	set_time_tag(tags.back());
+      else if (! d_timed)
+	set_time_now();
+
+      // fill, update rms and search all vectors delivered in this call
+      std::chrono::steady_clock::time_point t0 =
+	std::chrono::steady_clock::now();
+      nin = event(in, inB, out, noutput_items, nout);
+      std::chrono::steady_clock::time_point t1 =
+	std::chrono::steady_clock::now();
+      d_event_seconds += std::chrono::duration<double>(t1 - t0).count();
+      if ((d_stats_interval > 0.) &&
+	  (std::chrono::duration<double>(t1 - d_stats_last).count()
+	   >= d_stats_interval))
+	{ d_stats_last = t1;
+	  publish_stats();
+	}
+
       // Tell runtime system how many input items we consumed on
       // each input stream.
-      consume_each (noutput_items);
+      consume_each (nin);
 
       // Tell runtime system how many output items we produced.
-      return noutput_items;
+      if (d_monitor == NULL)
+	return nout;
+      produce(0, nout);
+      produce(1, d_nmon);
+      if (d_clean != NULL)    // one cleaned vector for each input vector
+	produce(2, nin);
+      return WORK_CALLED_PRODUCE;
     } // end of detect_impl:: general_work
     
 
     int
-    detect_impl::update_buffer()
-    { long i = inext2 - vlen2, length = vlen,
-	jstart = 0;
-
-      // now must reset the buffer to wait for the next event
-      bufferfull = false;
-
-      // if event is within the circular buffer 
-      if ((i >= 0) && ((i + length) < MAX_BUFF))
-	{ for (long j = 0; j < length; j++)
-	    { samples[j] = circular[i];
-	      i++;
+    detect_impl::update_buffer(long ipeak, gr_complex *event)
+    { long i = ipeak - d_pre;
+
+      initialized = 1;        // output now holds an event
+
+      if (i < 0)
+	i += d_nbuff;
+      else if (i >= d_nbuff)
+	i -= d_nbuff;
+      // the buffer is mapped twice, so the event is always contiguous
+      to_complex(event, circular + i*d_isize, d_ncapture);
+      if (d_ninputs > 1)      // the second input follows the first
+	to_complex(event + d_ncapture, circularB + i*d_isize, d_ncapture);
+      return 0;
+    } // end of update_buffer()
+
+    double
+    detect_impl::sum_ring(long istart, long n)
+    { float sum = 0;
+
+      if (istart < 0)
+	istart += d_nbuff;
+      volk_32f_accumulator_s32f(&sum, &circular2[istart], n);
+      return sum;
+    } // end of sum_ring()
+
+    void
+    detect_impl::update_window(float blocksum2, long n)
+    { long nold = 0;
+
+      // block at inext has just been written, update the window sum
+      if (d_nwindow <= n)  // whole window is inside this block
+	{ wsum2 = sum_ring(inext + n - d_nwindow, d_nwindow);
+	  wcount = d_nwindow;
+	}
+      else
+	{ wsum2 += blocksum2;
+	  wcount += n;
+	  if (wcount > d_nwindow)        // oldest samples leave the window
+	    { nold = wcount - d_nwindow;
+	      wsum2 -= sum_ring(inext + n - wcount, nold);
+	      wcount = d_nwindow;
 	    }
 	}
-      else if (i < 0)
-	{ i += MAX_BUFF;
-	  length = MAX_BUFF - i;
-       	  printf("Two part - shift; Move 1: i=%ld, length=%ld\n", i, length);
-	  for (long j = 0; j < length; j++)
-	    { samples[j] = circular[i];
-	      i++;
+
+      // until the window is full, the estimate fills the missing samples
+      if (d_rms0 > 0.)
+	rms2 = (wsum2 + (d_rms0*d_rms0*(d_nwindow - wcount)))/d_nwindow;
+      else
+	rms2 = wsum2/wcount;
+      rms = sqrt(rms2);
+      nsigma_rms = nsigma*nsigma*rms2;
+    } // end of update_window()
+
+    void
+    detect_impl::to_complex(gr_complex *output, const char *input, long n)
+    {
+      // integer samples keep their integer values
+      if (d_itype == INPUT_SC16)
+	volk_16i_s32f_convert_32f((float *) output, (const int16_t *) input,
+				  1., 2*n);
+      else if (d_itype == INPUT_SC8)
+	volk_8i_s32f_convert_32f((float *) output, (const int8_t *) input,
+				 1., 2*n);
+      else
+	memcpy(output, input, n*sizeof(gr_complex));
+    } // end of to_complex()
+
+    float
+    detect_impl::magnitude2(float *output, const char *input, long n)
+    { float sum = 0;
+
+      // integer samples are squared and summed exactly, in integers
+      if (d_itype == INPUT_SC16)
+	{ const int16_t *iq = (const int16_t *) input;
+	  uint64_t isum = 0;
+	  for (long i = 0; i < n; i++)
+	    { uint32_t m2 = uint32_t(int32_t(iq[2*i])*iq[2*i]) +
+		uint32_t(int32_t(iq[2*i+1])*iq[2*i+1]);
+	      output[i] = float(m2);
+	      isum += m2;
 	    }
-	  i = 0; 
-	  jstart = length;
-	  length = vlen - length;
-       	  printf("Two part - shift; Move 2: i=%ld, length=%ld\n", i, length);
-	  for (long j = jstart; j < vlen; j++)
-	    { samples[j] = circular[i];
-	      i++;
+	  sum = float(isum);
+	}
+      else if (d_itype == INPUT_SC8)
+	{ const int8_t *iq = (const int8_t *) input;
+	  int64_t isum = 0;
+	  for (long i = 0; i < n; i++)
+	    { int32_t m2 = int32_t(iq[2*i])*iq[2*i] +
+		int32_t(iq[2*i+1])*iq[2*i+1];
+	      output[i] = float(m2);
+	      isum += m2;
 	    }
+	  sum = float(isum);
 	}
       else
-	{  /* near end of circular buffer */
-	  length = MAX_BUFF - i;
-	  if (length > vlen)
-	    length = vlen;
-	  printf("Two part + shift; Move 1: i=%ld, length=%ld\n", i, length);  
-	  for (long j = 0; j < length; j++) 
-	    {
-	      samples[j] = circular[i];
-	      i++;
+	{ volk_32fc_magnitude_squared_32f(output, (const gr_complex *) input,
+					  n);
+	  volk_32f_accumulator_s32f(&sum, output, n);
+	}
+      return sum;
+    } // end of magnitude2()
+
+    void
+    detect_impl::plan_blocks(int nvectors)
+    { long inext_plan = inext, n = 0, nsamples = long(nvectors)*d_vec_length;
+      power_block block;
+
+      // the same blocks event() will fill, found from the fill index alone
+      d_plan.clear();
+      for (long j = 0; j < nsamples; j += n)
+	{ n = d_vec_length - (j % d_vec_length);
+	  if (n > d_nblock)
+	    n = d_nblock;
+	  if (n > d_nbuff - inext_plan)
+	    n = d_nbuff - inext_plan;
+	  block.offset = j;
+	  block.n = n;
+	  block.sum2 = 0;
+	  d_plan.push_back(block);
+	  inext_plan += n;
+	  if (inext_plan >= d_nbuff)
+	    inext_plan = 0;
+	}
+
+      if (nsamples > d_npower)   // grow the scratch power buffer
+	{ volk_free(d_power);
+	  d_npower = nsamples;
+	  d_power = (float *) volk_malloc(d_npower*sizeof(float),
+					  volk_get_alignment());
+	}
+    } // end of plan_blocks()
+
+    void
+    detect_impl::power_shard(const char *input, int ishard, int nshards)
+    { long nplan = d_plan.size();
+      long first = (nplan*ishard)/nshards, last = (nplan*(ishard + 1))/nshards;
+
+      for (long i = first; i < last; i++)
+	{ power_block &block = d_plan[i];
+	  block.sum2 = magnitude2(d_power + block.offset,
+				  input + block.offset*d_isize, block.n);
+	}
+    } // end of power_shard()
+
+    void
+    detect_impl::monitor_block(float blocksum2, long n)
+    { uint32_t imax = 0;
+
+      // block at inext has just been written
+      volk_32f_index_max_32u(&imax, &circular2[inext], n);
+      if (circular2[inext + imax] > d_mpeak2)
+	{ d_mpeak2 = circular2[inext + imax];
+	  d_mpeakat = d_mcount + imax;
+	}
+      d_msum2 += blocksum2;
+      d_mcount += n;
+    } // end of monitor_block()
+
+    void
+    detect_impl::monitor_record()
+    { float *record = d_monitor + long(d_nmon)*MONITOR_LEN;
+
+      record[0] = (d_mcount > 0) ? sqrt(d_msum2/d_mcount) : 0.;
+      record[1] = sqrt(d_mpeak2);
+      record[2] = d_mpeakat;
+      record[3] = d_mevents;
+      d_nmon++;
+
+      d_mvectors = 0;         // start the next interval
+      d_mcount = 0;
+      d_msum2 = 0;
+      d_mpeak2 = 0;
+      d_mpeakat = 0;
+      d_mevents = 0;
+    } // end of monitor_record()
+
+    void
+    detect_impl::blank_block(long iscan, long n, gr_complex *clean)
+    { long first = iscan - d_nguard, last = iscan + n + d_nguard;
+      long done = iscan, lo = 0, hi = 0;
+      float thresh = d_blank2*rms2, sigma = rms*M_SQRT1_2;
+      uint32_t imax = 0;
+
+      to_complex(clean, circular + iscan*d_isize, n);
+      if ((d_blank2 <= 0.) || (rms2 <= 0.))
+	return;
+
+      // samples within the guard of this block can blank it
+      volk_32f_index_max_32u(&imax, &circular2[first], last - first);
+      if (circular2[first + imax] <= thresh)  // most blocks stop here
+	return;
+
+      for (long i = first; i < last; i++)
+	{ if (circular2[i] <= thresh)
+	    continue;
+	  if ((i >= iscan) && (i < iscan + n)) // count each impulse once
+	    d_nimpulses++;
+	  lo = std::max(i - d_nguard, done);
+	  hi = std::min(i + d_nguard + 1, iscan + n);
+	  for (long j = lo; j < hi; j++)
+	    clean[j - iscan] = d_blank_noise ?
+	      gr_complex(sigma*d_rng.gasdev(), sigma*d_rng.gasdev()) :
+	      gr_complex(0., 0.);
+	  if (hi > lo)
+	    { d_nblanked += hi - lo;
+	      done = hi;
 	    }
-	  i = 0;
-	  jstart = length;
-	  length = vlen - length;
-	  printf("Two part + shift; Move 2: i=%ld, shift=%ld\n", i, length);
-	  for (long j = jstart; j < vlen; j++)
-	    {
-	      samples[j] = circular[i];
-	      i++;
+	}
+    } // end of blank_block()
+
+    float
+    detect_impl::bin_edge(int ibin)
+    { uint32_t bits = uint32_t(ibin) << HIST_SHIFT;
+      float edge = 0;
+
+      memcpy(&edge, &bits, sizeof(edge));
+      return edge;
+    } // end of bin_edge()
+
+    void
+    detect_impl::histogram_block(long n)
+    { uint32_t bits = 0;
+
+      // the float exponent and top mantissa bits are the log2 bin;
+      // the mask drops the sign bit a NaN may carry
+      for (long i = inext; i < inext + n; i++)
+	{ memcpy(&bits, &circular2[i], sizeof(bits));
+	  d_hcount[(bits >> HIST_SHIFT) & (HIST_BINS - 1)]++;
+	}
+      d_hsamples += n;
+      if (d_hsamples >= d_rate)   // once a second of samples
+	histogram_update();
+    } // end of histogram_block()
+
+    void
+    detect_impl::histogram_update()
+    { double memory = (d_target > 0.) ? HIST_EVENTS/d_target : HIST_SECONDS;
+      double decay = exp(-1./memory), allowed = 0, above = 0, threshold = 0;
+      int ibin = HIST_BINS - 1;
+
+      {
+	boost::mutex::scoped_lock lock(d_hlock);
+	for (int i = 0; i < HIST_BINS; i++)
+	  { d_hist[i] = decay*d_hist[i] + d_hcount[i];
+	    d_hcount[i] = 0;
+	  }
+      }
+      d_hsamples = 0;
+      d_hseconds = decay*d_hseconds + 1.;
+      if ((d_target <= 0.) || (rms2 <= 0.))
+	return;
+
+      // the histogram holds the sum of decay^k seconds of samples,
+      // only reaching 1/(1 - decay) after many updates.  Find the
+      // lowest bin edge with no more samples above it than the target
+      // rate allows in that time.
+      allowed = d_target*d_hseconds;
+      while ((ibin > 0) && (above + d_hist[ibin - 1] <= allowed))
+	above += d_hist[--ibin];
+      threshold = bin_edge(ibin);
+
+      nsigma = sqrt(threshold/rms2);
+      if (nsigma < 1.)
+	nsigma = 1.;
+      nsigma_rms = nsigma*nsigma*rms2;
+      set_box_thresholds();
+      d_log->work(log_ring::DEBUG, "Adaptive N Sigma: %7.2f\n", nsigma);
+    } // end of histogram_update()
+
+    std::vector<float>
+    detect_impl::get_histogram()
+    { boost::mutex::scoped_lock lock(d_hlock);
+
+      return std::vector<float>(d_hist, d_hist + HIST_BINS);
+    } // end of get_histogram()
+
+    std::vector<float>
+    detect_impl::get_histogram_edges()
+    { std::vector<float> edges(HIST_BINS);
+
+      for (int i = 0; i < HIST_BINS; i++)
+	edges[i] = bin_edge(i);
+      return edges;
+    } // end of get_histogram_edges()
+
+    void
+    detect_impl::latest(gr_complex *output)
+    { long i = inext - d_ncapture;
+
+      // copy the last capture length samples written, in time order
+      if (i < 0)
+	i += d_nbuff;
+      to_complex(output, circular + i*d_isize, d_ncapture);
+      if (d_ninputs > 1)
+	to_complex(output + d_ncapture, circularB + i*d_isize, d_ncapture);
+    } // end of latest()
+
+    long
+    detect_impl::find_peak(long istart, long n)
+    { uint32_t imax = 0;
+
+      // one vector pass finds the block maximum; most blocks stop here
+      volk_32f_index_max_32u(&imax, &circular2[istart], n);
+      if (circular2[istart + imax] <= nsigma_rms)
+	return -1;
+
+      // an event is present, find the first sample above threshold
+      for (long j = istart; j < istart + long(imax); j++)
+	{ if (circular2[j] > nsigma_rms)
+	    return d_boxend = j;
+	}
+      return d_boxend = istart + imax;
+    } // end of find_peak()
+
+    long
+    detect_impl::find_boxcar(long istart, long n, long last)
+    { const float *p = &circular2[istart]; // p[i] is buffer index istart + i
+      double box[MAX_WIDTHS], thresh[MAX_WIDTHS], over = 0, best = 0;
+      double excess[MAX_WIDTHS];
+      double boxbest = 0;
+      long i = 0, ifirst = -1, ibest = -1, cmax = inext2 - istart;
+      int iw = 0, w = 0, wbest = 1;
+
+      for (iw = 0; iw < d_nwidths; iw++)
+	{ w = 1 << iw;
+	  box[iw] = 0;
+	  for (i = -w; i < 0; i++)    // boxcar ending before istart
+	    box[iw] += p[i];
+	  thresh[iw] = d_boxthresh[iw]*rms2;
+	  excess[iw] = thresh[iw] - w*rms2;
+	}
+
+      // slide all boxcars through the block.  After the first
+      // crossing, continue one widest boxcar further, into the
+      // samples filled past the block, to find the best width.
+      // Boxcars centered past the block searched are left for the
+      // next block, as their capture is not yet written.
+      for (i = 0; i < last; i++)
+	{ if ((ifirst < 0) ? (i >= n) : (i >= ifirst + d_maxwidth))
+	    break;
+	  for (iw = 0; iw < d_nwidths; iw++)
+	    { w = 1 << iw;
+	      box[iw] += p[i] - p[i - w];
+	      if ((box[iw] <= thresh[iw]) || (i - w/2 > cmax))
+		continue;
+	      if (ifirst < 0)
+		ifirst = i;
+	      // the best width is furthest above its own threshold
+	      over = (box[iw] - w*rms2)/excess[iw];
+	      if (over > best)
+		{ best = over;
+		  boxbest = box[iw];
+		  ibest = i;
+		  wbest = w;
+		}
 	    }
-	} // else near end of circular buffer
-    return 0;
-  } // end of update_buffer()
-    
+	}
+      if (ibest < 0)
+	return -1;
+
+      // the event is the center of the winning boxcar
+      d_boxwidth = wbest;
+      d_boxend = istart + ibest;
+      d_peak2 = boxbest/wbest;
+      return istart + ibest - wbest/2;
+    } // end of find_boxcar()
+
+    void
+    detect_impl::set_box_thresholds()
+    { double target = -nsigma*nsigma, lo = 0, hi = 0, t = 0;
+      int w = 0;
+
+      // the sum of w white noise powers, in units of rms2, has the
+      // Erlang tail P(sum > t) = exp(-t) sum(k < w) t^k/k!.  One sample
+      // exceeds nsigma^2 with probability exp(-nsigma^2); each width
+      // gets the threshold with the same false alarm probability.
+      for (int iw = 0; iw < MAX_WIDTHS; iw++)
+	{ w = 1 << iw;
+	  lo = w;
+	  hi = w + 1.;
+	  while (log_erlang_tail(w, hi) > target)
+	    hi = w + 2.*(hi - w);
+	  for (int i = 0; i < 50; i++)
+	    { t = 0.5*(lo + hi);
+	      if (log_erlang_tail(w, t) > target)
+		lo = t;
+	      else
+		hi = t;
+	    }
+	  d_boxthresh[iw] = hi;
+	}
+    } // end of set_box_thresholds()
+
+    double
+    detect_impl::log_erlang_tail(int w, double t)
+    { double lmax = 0, sum = 0, lt = log(t);
+
+      // log of exp(-t) sum(k < w) t^k/k!, summed without overflow;
+      // the largest term is at k = w - 1 for t >= w
+      lmax = (w - 1)*lt - lgamma(double(w));
+      for (int k = 0; k < w; k++)
+	sum += exp(k*lt - lgamma(k + 1.) - lmax);
+      return -t + lmax + log(sum);
+    } // end of log_erlang_tail()
+
+    int
+    detect_impl::tier(float peak2, int width)
+    { double sigma = 0;
+      int itier = 0;
+
+      if (rms2 <= 0.)
+	return d_ntiers;
+      // the nsigma whose threshold this event just reaches; for one
+      // sample, sqrt(peak2/rms2)
+      sigma = -log_erlang_tail(width, width*peak2/rms2);
+      sigma = (sigma > 0.) ? sqrt(sigma) : 0.;
+      while ((itier < d_ntiers) && (sigma >= d_tiers[itier]))
+	itier++;
+      return itier;
+    } // end of tier()
+
+    void
+    detect_impl::fill_second(const char *input, long n)
+    { float blocksum2 = 0;
+
+      // called before inext moves past the block
+      memcpy(circularB + inext*d_isize, input, n*d_isize);
+      blocksum2 = magnitude2(&circular2B[inext], input, n);
+      sum2B += blocksum2;
+      if (inext + n >= d_nbuff)  // rms of the whole buffer
+	{ rms2B = sum2B*oneovern;
+	  sum2B = 0;
+	}
+    } // end of fill_second()
+
+    bool
+    detect_impl::coincident(long ipeak)
+    { long first = ipeak - d_ncoinc;
+      uint32_t imax = 0;
+
+      if (rms2B <= 0.)        // no noise estimate for the second input
+	return false;
+      volk_32f_index_max_32u(&imax, &circular2B[first], 2*d_ncoinc + 1);
+      return circular2B[first + imax] > nsigma*nsigma*rms2B;
+    } // end of coincident()
+
+    long
+    detect_impl::find_trigger(long istart, long n)
+    { long ipeak = find_event(istart, n), end = istart + n, next = istart;
+
+      // with two inputs, skip peaks not seen in the second input
+      while ((d_ninputs > 1) && (ipeak >= 0) && (! coincident(ipeak)))
+	{ next = std::max(ipeak, next) + 1;
+	  ipeak = (next < end) ? find_event(next, end - next) : -1;
+	}
+      return ipeak;
+    } // end of find_trigger()
+
+    long
+    detect_impl::find_coarse(long istart, long n)
+    { long first = (d_nwidths > 1) ? 1 - d_maxwidth : 0, nbins = 0;
+      long last = n + std::min(long(d_maxwidth), long(d_post));
+      long b = 0, b0 = 0, s = 0, e = 0, ipeak = -1;
+      double thresh[MAX_WIDTHS];
+      int span[MAX_WIDTHS], iw = 0, w = 0;
+
+      // running sums of bins starting with the first sample the widest
+      // boxcar ending at istart reads: d_bins[b] sums the bins before b
+      nbins = (n - first + d_nbin - 1)/d_nbin;
+      d_bins.resize(nbins + 1);
+      d_bins[0] = 0;
+      for (b = 0; b < nbins; b++)
+	{ s = first + b*d_nbin;
+	  e = std::min(s + d_nbin, n);
+	  d_bins[b+1] = d_bins[b] + sum_ring(istart + s, e - s);
+	}
+
+      // a boxcar of w samples lies within span bins; powers are never
+      // negative, so it can only cross if those bins sum above its
+      // threshold.  One sample is a boxcar of width 1.
+      for (iw = 0; iw < d_nwidths; iw++)
+	{ w = 1 << iw;
+	  span[iw] = (w + 2*d_nbin - 2)/d_nbin;
+	  thresh[iw] = (d_nwidths > 1) ? d_boxthresh[iw]*rms2 : nsigma_rms;
+	}
+
+      // run the full rate search only over runs of flagged bins
+      for (b = -first/d_nbin; b < nbins; b++)
+	{ if (! coarse_flag(b, span, thresh))
+	    continue;
+	  for (b0 = b; (b + 1 < nbins) && coarse_flag(b + 1, span, thresh); )
+	    b++;
+	  s = std::max(first + b0*d_nbin, 0L);
+	  e = std::min(first + (b + 1)*d_nbin, n);
+	  if (d_nwidths > 1)
+	    ipeak = find_boxcar(istart + s, e - s, last - s);
+	  else if ((ipeak = find_peak(istart + s, e - s)) >= 0)
+	    d_peak2 = circular2[ipeak];
+	  if (ipeak >= 0)
+	    return ipeak;
+	}
+      return -1;
+    } // end of find_coarse()
+
+    bool
+    detect_impl::coarse_flag(long b, const int *span, const double *thresh)
+    {
+      for (int iw = 0; iw < d_nwidths; iw++)
+	{ if (d_bins[b+1] - d_bins[std::max(0L, b + 1 - span[iw])] > thresh[iw])
+	    return true;
+	}
+      return false;
+    } // end of coarse_flag()
+
+    long
+    detect_impl::find_event(long istart, long n)
+    { long ipeak = 0;
+
+      if (d_nbin > 0)             // two stage search
+	return find_coarse(istart, n);
+      if (d_nwidths > 1)
+	return find_boxcar(istart, n,
+			   n + std::min(long(d_maxwidth), long(d_post)));
+      ipeak = find_peak(istart, n);
+      if (ipeak >= 0)
+	d_peak2 = circular2[ipeak];
+      return ipeak;
+    } // end of find_event()
+
+    void
+    detect_impl::tag_event(int k, float peak2, long long isample)
+    { double dmjd = 0;
+      int width = 1;
+
+      peak = sqrt(peak2);
+      // printf( "N-sigma Peak found: %7.1f\n", peak/rms);
+      // add tags to the output vector carrying this event
+      event_tag(k, "PEAK", pmt::from_double(peak));
+      event_tag(k, "RMS", pmt::from_double(rms));
+      dmjd = sample_mjd(isample);
+      d_lastmjd = dmjd;
+      d_log->work(log_ring::INFO, "Event MJD: %15.6f; Peak=%8.4f+/-%6.4f\n",
+		  dmjd, peak, rms);
+
+      event_tag(k, "MJD", pmt::from_double(dmjd));
+
+      width = clustering() ? bboxcar : d_boxwidth;
+      if (d_nwidths > 1)          // width of the best boxcar
+	event_tag(k, "BOXCAR", pmt::from_long(width));
+      if (d_ntiers > 0)           // number of tiers the event crossed
+	event_tag(k, "TIER", pmt::from_long(tier(peak2, width)));
+
+      if (! clustering())
+	return;
+      // describe the whole burst
+      event_tag(k, "PEAKINDEX", pmt::from_uint64(bpeakat));
+      event_tag(k, "WIDTH", pmt::from_long(long(blast - bstart + 1)));
+      event_tag(k, "FLUENCE", pmt::from_double(bfluence));
+      event_tag(k, "START", pmt::from_uint64(bstart));
+      event_tag(k, "STOP", pmt::from_uint64(blast));
+    } // end of tag_event()
+
+    void
+    detect_impl::event_tag(int k, const char *key, const pmt::pmt_t &value)
+    { gr::tag_t tag;
+
+      if (d_nt != MODE_EVENTS)
+	{ add_item_tag(0, nitems_written(0) + k, pmt::mp(key), value);
+	  return;
+	}
+      tag.offset = k;            // index of the queued event
+      tag.key = pmt::mp(key);
+      tag.value = value;
+      d_qtags.push_back(tag);
+    } // end of event_tag()
+
+    void
+    detect_impl::output_event(int k, float peak2, long long isample)
+    {
+      d_mevents++;                // count events for the monitor
+      d_nevents++;
+      if (d_nt != MODE_EVENTS)    // event is repeated from vector k
+	{ tag_event(k, peak2, isample);
+	  return;
+	}
+      // queue each new event; it is output once there is room
+      tag_event(d_nqueued, peak2, isample);
+      d_queue.insert(d_queue.end(), samples, samples + d_noutput);
+      d_nqueued++;
+    } // end of output_event()
+
+    void
+    detect_impl::deliver(gr_complex *output, int &nout, int nvectors)
+    { int n = std::min(d_nqueued, nvectors - nout);
+      std::vector<gr::tag_t> later;
+
+      if (n <= 0)
+	return;
+      memcpy(output + (long(nout)*d_noutput), &d_queue[0],
+	     long(n)*d_noutput*sizeof(gr_complex));
+      for (size_t i = 0; i < d_qtags.size(); i++)
+	{ gr::tag_t tag = d_qtags[i];
+	  if (tag.offset < uint64_t(n))
+	    add_item_tag(0, nitems_written(0) + nout + tag.offset,
+			 tag.key, tag.value);
+	  else                   // renumber events still queued
+	    { tag.offset -= n;
+	      later.push_back(tag);
+	    }
+	}
+      d_qtags.swap(later);
+      d_queue.erase(d_queue.begin(), d_queue.begin() + long(n)*d_noutput);
+      d_nqueued -= n;
+      nout += n;
+    } // end of deliver()
+
+    void
+    detect_impl::cluster(long iscan, long n, int k)
+    { long j = iscan, end = iscan + n, limit = 0, ipeak = 0, nsum = 0;
+      long long a0 = d_nscan - iscan;  // sample number of buffer index 0
+
+      // a boxcar may end past the last block; do not count it twice
+      if (inburst && (blast + 1 - a0 > j))
+	j = long(blast + 1 - a0);
+      while (j < end)
+	{ if (! inburst)
+	    { if (a0 + j < bholdoff)    // wait until hold off has passed
+		{ j = long(bholdoff - a0);
+		  continue;
+		}
+	      ipeak = find_trigger(j, end - j);
+	      if (ipeak < 0)
+		break;
+	      // start a new burst, holding the whole winning boxcar.  The
+	      // search goes on after its end; its center may be before j.
+	      inburst = true;
+	      bpeakat = a0 + ipeak;
+	      blast = a0 + d_boxend;
+	      bstart = blast - d_boxwidth + 1;
+	      bpeak2 = d_peak2;
+	      bboxcar = d_boxwidth;
+	      bfluence = sum_ring(d_boxend - d_boxwidth + 1, d_boxwidth) -
+		d_boxwidth*rms2;
+	      update_buffer(ipeak, pending);
+	      j = d_boxend + 1;
+	      continue;
+	    }
+
+	  // inside a burst, look for the next sample above threshold
+	  limit = long(blast + d_ngap + 1 - a0);
+	  if (limit > end)
+	    limit = end;
+	  ipeak = (limit > j) ? find_trigger(j, limit - j) : -1;
+	  if (ipeak >= 0)
+	    { // burst continues, include all samples up to the boxcar end
+	      nsum = std::max(0L, d_boxend - j + 1);
+	      bfluence += sum_ring(j, nsum) - nsum*rms2;
+	      blast = std::max(blast, a0 + d_boxend);
+	      if (d_peak2 > bpeak2)
+		{ bpeak2 = d_peak2;
+		  bboxcar = d_boxwidth;
+		  bpeakat = a0 + ipeak;
+		  update_buffer(ipeak, pending);
+		}
+	      j = std::max(j, d_boxend) + 1; // never back
+	    }
+	  else if (a0 + limit > blast + d_ngap)
+	    { // merge gap passed without a new sample, burst is over
+	      std::swap(samples, pending);
+	      initialized = 1;
+	      imax2 = long(bpeakat % d_nbuff);
+	      output_event(k, bpeak2, bpeakat);
+	      inburst = false;
+	      bholdoff = blast + d_nholdoff + 1;
+	      j = limit;
+	    }
+	  else                        // burst continues in the next block
+	    j = end;
+	} // end while samples in block
+    } // end of cluster()
+
     int
-    detect_impl::event(const gr_complex *input, gr_complex *output)
+    detect_impl::event(const char *input, const char *inputB,
+		       gr_complex *output, int nvectors, int &nout)
     {
-      //outbuf = (float *) //create fresh one if necessary
-      float n_sigma = d_dms; // translate variables 
-      int vlen = d_vec_length;
-      gr_complex rp = 0;
-      double mag2 = 0, dmjd = 0;
+      int vlen = d_vec_length, k = 0, nshards = 0;
+      long n = 0, iscan = 0, ipeak = 0, iblock = 0;
+      float blocksum2 = 0;
+      bool sharded = false;
       
-      // fill the circular buffer
-      for(unsigned int j=0; j < vlen; j++)
-	{ rp = input[j];
-	  mag2 = (rp.real()*rp.real()) + (rp.imag()*rp.imag());
-	  circular[inext] = rp;
-	  circular2[inext] = mag2;
-	  sum2 += mag2;
-	  inext++;
-	  if (inext >= MAX_BUFF) // if buffer is full
-	    { rms2 = sum2*oneovern;
-	      rms = sqrt(rms2);
-	      inext = 0;
-	      bufferfull = true; // flag buffer is now full
-	      nsigma_rms = nsigma*nsigma*rms2;
-	      sum2 = 0;          // restart rms sum
+      nout = 0;
+      if ((d_nt != MODE_EVENTS) && (d_nqueued > 0)) // mode was changed
+	{ d_log->work(log_ring::WARN, "Events dropped, mode changed: %d\n",
+		      d_nqueued);
+	  d_queue.clear();
+	  d_qtags.clear();
+	  d_nqueued = 0;
+	}
+      // with worker threads, find the magnitude squared of all samples
+      // first, in contiguous shards of the blocks filled below
+      if ((d_pool != NULL) && (long(nvectors)*vlen >= MIN_SHARD))
+	{ plan_blocks(nvectors);
+	  nshards = std::min(long(d_pool->size()),
+			     long(nvectors)*vlen/(MIN_SHARD/2));
+	  d_pool->run(nshards, boost::bind(&detect_impl::power_shard, this,
+					   input, _1, nshards));
+	  sharded = true;
+	}
+      for (k = 0; k < nvectors; k++)
+	{ const char *invec = input + (long(k)*vlen*d_isize);
+	  gr_complex *outvec = output + (long(k)*d_noutput);
+
+	  // only output events; search no further until all events
+	  // found so far are out
+	  if (d_nt == MODE_EVENTS)
+	    { deliver(output, nout, nvectors);
+	      if (d_nqueued > 0)
+		break;
 	    }
-	  inext2++;              // update position for search 
-	  if (inext2 >= MAX_BUFF) // if at end of circular buffer
-	    inext2 = 0;           // go back to beginning
-	  if (bufferfull)         // when buffer is full, find peaks
-	    {
-	      if (circular2[inext2] > nsigma_rms)
-		{
-		  imax2 = inext2;
-		  peak = sqrt(circular2[inext2]);
-		  // printf( "N-sigma Peak found: %7.1f\n", peak/rms);
-		  // add tags to event
-		  add_item_tag(0, // Port number
-			       nitems_written(0) + 1, // Offset
-			       pmt::mp("PEAK"), // Key
-			       pmt::from_double(peak) // Value
-			       );
-		  add_item_tag(0, // Port number
-			       nitems_written(0) + 1, // Offset
-			       pmt::mp("RMS"), // Key
-			       pmt::from_double(rms) // Value
-			       );
-		  dmjd = get_mjd();
-		  printf("Event MJD: %15.6f; Peak=%8.4f+/-%6.4f\n", dmjd, peak, rms);
-
-		  add_item_tag(0, // Port number
-			       nitems_written(0) + 1, // Offset
-			       pmt::mp("MJD"), // Key
-			       pmt::from_double(dmjd) // Value
-			       );
-
-		  update_buffer();
-		} // end if an event found
-	    } // end if buffere full
-	} // end for all samples
+
+	  // fill the circular buffer a block at a time.  The search trails
+	  // the fill by the post trigger samples, so every sample searched
+	  // already has its full capture in the buffer.  Blocks end where
+	  // the fill wraps; the search reads on into the second mapping.
+	  for (long j = 0; j < vlen; j += n)
+	    { iscan = inext - d_post;  // next place to search for a peak
+	      if (iscan < d_lookback)  // wrap; boxcars reach back before it
+		iscan += d_nbuff;
+	      n = vlen - j;
+	      if (n > d_nblock)
+		n = d_nblock;
+	      if (n > d_nbuff - inext)
+		n = d_nbuff - inext;
+
+	      memcpy(circular + inext*d_isize, invec + j*d_isize, n*d_isize);
+	      if (sharded)
+		{ memcpy(&circular2[inext], d_power + d_plan[iblock].offset,
+			 n*sizeof(float));
+		  blocksum2 = d_plan[iblock++].sum2;
+		}
+	      else
+		blocksum2 = magnitude2(&circular2[inext], invec + j*d_isize, n);
+	      sum2 += blocksum2;
+	      if (d_nwindow > 0)     // running noise window
+		update_window(blocksum2, n);
+	      if (d_monitor != NULL) // statistics for the monitor port
+		monitor_block(blocksum2, n);
+	      if (d_histogram || (d_target > 0.))
+		histogram_block(n);
+	      if (d_ninputs > 1)     // second input, into the same places
+		fill_second(inputB + (long(k)*vlen + j)*d_isize, n);
+	      inext += n;
+	      if (inext >= d_nbuff) // if buffer is full
+		{ if (d_nwindow > 0)  // remove round off in the window sum
+		    wsum2 = sum_ring(d_nbuff - wcount, wcount);
+		  else
+		    { rms2 = sum2*oneovern;
+		      rms = sqrt(rms2);
+		      nsigma_rms = nsigma*nsigma*rms2;
+		    }
+		  inext = 0;
+		  bufferfull = true; // flag buffer is now full
+		  sum2 = 0;          // restart rms sum
+		}
+
+	      if (d_clean != NULL)   // cleaned copy of the block searched
+		blank_block(iscan, n, d_clean + long(k)*vlen + j);
+
+	      inext2 = iscan + n - 1;  // last place searched in this block
+	      if (bufferfull && clustering()) // one event for each burst
+		cluster(iscan, n, k);
+	      else if (bufferfull)     // when buffer is full, find peaks
+		{ ipeak = find_trigger(iscan, n);
+		  if (ipeak >= 0)
+		    { // the search resumes once the buffer is full again
+		      imax2 = ipeak;
+		      bufferfull = false;
+		      update_buffer(ipeak, samples);
+		      output_event(k, d_peak2, d_nscan + (ipeak - iscan));
+		    } // end if an event found
+		} // end if buffer full
+	      d_nscan += n;
+	    } // end for all blocks in this vector
+
+	  if ((d_monitor != NULL) && (++d_mvectors >= d_monvectors))
+	    monitor_record();
 	      
-      if (! initialized) {
-	for (int iii = 0; iii < vlen; iii++)
-	  { samples[iii] = input[iii];
+	  if (d_nt == MODE_EVENTS) // events are already output
+	    continue;
+
+	  if (! initialized) {  // until the first event, output latest
+	    latest(samples);
+	    initialized = 1;     // no need to re-initialize the event
 	  }
-	initialized = 1;     // no need to re-initialize the event
-      }
 
-      if (d_nt == 0) // if monitoring input, just output input 
-	{
-	  // always output the last event
-	  for (int iii = 0; iii < vlen; iii++)
-	    { output[iii] = input[iii];
+	  nout++;
+	  if (d_nt == MODE_MONITOR) // if monitoring, output the latest samples
+	    { if ((d_ncapture == vlen) && (d_ninputs == 1))
+		to_complex(outvec, invec, vlen);
+	      else
+		latest(outvec);
 	    }
-	}
-      else {
-	// output the last event
-	for (int iii = 0; iii < vlen; iii++)
-	  { output[iii] = samples[iii];
-	  }
-      } // end else output event
+	  else         // output the last event
+	    memcpy(outvec, samples, d_noutput*sizeof(gr_complex));
+	} // end for all input vectors
 
-      return 0;
+      if (d_nt == MODE_EVENTS) // events of the last vector, if there is room
+	deliver(output, nout, nvectors);
+      return k;
     } // end of detect_impl::event()
 
   } /* namespace radio_astro */
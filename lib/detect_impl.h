@@ -22,13 +22,43 @@
 #define INCLUDED_RADIO_ASTRO_DETECT_IMPL_H
 
 #include <radio_astro/detect.h>
+#include "double_mapped_ring.h"
+#include "log_ring.h"
+#include "shard_pool.h"
+#include <boost/thread/mutex.hpp>
+#include <gnuradio/random.h>
+#include <vector>
+#include <chrono>
+#include <cmath>
 
 #ifndef TIME_UTC                   // must define utc time flag
 #define TIME_UTC    1
 #endif
 
-#define MAX_VLEN 16384
-#define MAX_BUFF (2L*MAX_VLEN)
+#define MAX_BLOCK 8192L      // most samples searched per kernel call
+
+#define MAX_WIDTHS 9         // boxcar widths 1, 2, 4, ... 256 samples
+#define MAX_BOXCAR (1 << (MAX_WIDTHS - 1)) // widest boxcar, samples
+
+#define MAX_TIERS  8         // most sigma tiers events are classified by
+
+#define MONITOR_LEN 4        // monitor record: rms, peak, peak index, events
+
+#define HIST_SHIFT 21        // float bits to histogram bin: 4 bins per octave
+#define HIST_BINS (1 << (32 - HIST_SHIFT - 1)) // all positive floats
+#define HIST_SECONDS 60.     // histogram memory, without a target rate
+#define HIST_EVENTS 10.      // histogram memory, in target event intervals
+
+#define MAX_THREADS 16       // most threads finding magnitudes squared
+#define MIN_SHARD 65536L     // fewest samples in a call worth sharding
+
+#define INPUT_FC32   0       // complex float input samples
+#define INPUT_SC16   1       // complex int16 input samples
+#define INPUT_SC8    2       // complex int8 input samples
+
+#define MODE_MONITOR 0       // output the latest samples
+#define MODE_EVENTS  3       // output only newly detected events
+                             // all other modes repeat the last event
 
 // constants for calculating Modified Julian Date
 #define DaysPer400Years   (365L*400 + 97)
@@ -39,6 +69,7 @@
 #define MonthsPer400Years (12*400)
 #define MonthMarch        3
 #define mjdOffset         (678881  /* Epoch Nov 17, 1858 */)
+#define MJD_UNIX_EPOCH    40587    /* MJD of 1970 January 1 */
 
 static const short DaysMarch1ToBeginingOfMonth[12] = { 
   0, 
@@ -57,6 +88,13 @@ static const short DaysMarch1ToBeginingOfMonth[12] = {
 namespace gr {
   namespace radio_astro {
 
+    // a block of samples filled into the circular buffer at once
+    struct power_block {
+      long offset;            // first sample, from the start of the call
+      long n;                 // number of samples
+      float sum2;             // sum of their magnitudes squared
+    };
+
     class detect_impl : public detect
     {
      private:
@@ -67,29 +105,117 @@ namespace gr {
       float d_bw = 1.;
       float d_t_int = 0.;
       int d_nt = 1;
+      int d_pre = 1024;       // samples captured before the event
+      int d_post = 1024;      // samples captured from the event onward
+      int d_ncapture = 2048;  // samples in each captured event
+      int d_itype = INPUT_FC32; // input sample type
+      int d_isize = sizeof(gr_complex); // bytes in one input sample
+      int d_ninputs = 1;      // inputs; with 2, events must be in both
+      int d_noutput = 2048;   // samples in each output vector, all inputs
+      long d_nblock = MAX_BLOCK;   // most samples processed at once
+      long d_nbuff = 2048 + MAX_BLOCK; // samples in the circular buffer
+      std::vector<gr_complex> d_queue; // events mode: events not yet output
+      std::vector<gr::tag_t> d_qtags;  // their tags; offset is queue index
+      int d_nqueued = 0;      // events in the queue
+      int d_ngap = 0;         // samples below threshold that end a burst
+      int d_nholdoff = 0;     // samples after a burst before the next
+      long d_nwindow = 0;     // running noise window; 0: whole buffer
+      int d_nwidths = 1;      // number of boxcar widths searched
+      int d_maxwidth = 1;     // widest boxcar, samples
+      long d_lookback = 0;    // samples the search reads before its start
+      int d_boxwidth = 1;     // width of the boxcar of the last peak found
+      long d_boxend = 0;      // buffer index of the last sample in it
+      double d_boxthresh[MAX_WIDTHS]; // boxcar thresholds, units of rms2
+      float d_peak2 = 0;      // mean power in that boxcar
+      float d_tiers[MAX_TIERS]; // sigma tiers, increasing
+      int d_ntiers = 0;       // number of sigma tiers; 0: not tagged
+      double d_rms0 = 0;      // estimated rms before the window fills
       int vlen = d_vec_length;
-      int vlen2 = vlen/2;
       double nsigma = 4.0;
       double peak = 0;        // peak, rms and date/time of detected event
       double rms = 0;         // rms of values in circular buffer
       double mjd = 0;         // modified Julian Date of event
-      gr_complex circular[MAX_BUFF];
-      float circular2[MAX_BUFF];   // circular buffer for input samples**2
+      double_mapped_ring *ring = NULL;  // memory for circular buffers
+      double_mapped_ring *ring2 = NULL;
+      char *circular = NULL;       // circular buffer for input samples
+      float *circular2 = NULL;     // circular buffer for input samples**2
       long inext = 0;         // next place for a sample in buffer
-      long inext2 = MAX_BUFF/2;  // place to check for new peak
+      long inext2 = 0;        // place to check for new peak
       long imax2 = 0;         // index to last maximum
       double max2 = 0;        // max value squared so far
       double sum2 = 0;        // sum of values squared
       double rms2 = 0;        // rms squared of values in circular buffer
-      double oneovern = 1./double(MAX_BUFF);
+      double oneovern = 1./double(d_nbuff);
       bool bufferfull = false;// assume buffer is not full 
+      double wsum2 = 0;       // sum of values squared in noise window
+      long wcount = 0;        // number of samples in noise window
       double nsigma_rms = 0;  // comparision value for event detection
-      gr_complex samples[MAX_VLEN];  // output event buffer 
+      gr_complex *samples = NULL;  // output event buffer 
+      gr_complex *pending = NULL;  // event buffer for burst in progress
+      double_mapped_ring *ringB = NULL; // circular buffers for the
+      double_mapped_ring *ring2B = NULL;// second input
+      char *circularB = NULL;
+      float *circular2B = NULL;
+      double sum2B = 0;       // sum of second input values squared
+      double rms2B = 0;       // rms squared of the second input buffer
+      int d_ncoinc = 0;       // samples between coincident peaks
+      long long d_nscan = 0;  // sample number of next sample to search
+      bool inburst = false;   // a burst has started, but not yet ended
+      long long bstart = 0;   // sample numbers of the burst start,
+      long long blast = 0;    // last sample above threshold
+      long long bpeakat = 0;  // and burst peak
+      long long bholdoff = 0; // first sample number that can start a burst
+      float bpeak2 = 0;       // peak of burst squared
+      int bboxcar = 1;        // boxcar width at the burst peak
+      double bfluence = 0;    // sum of burst samples squared above rms**2
+      double d_rate = 1.E6;   // samples per second
+      int d_day0 = 0;         // MJD day and seconds of day of sample
+      double d_sec0 = 0;      // number d_sample0, for event times
+      long long d_sample0 = 0;
+      bool d_timed = false;   // time set from start time or rx_time tag
+      bool d_tagged = false;  // time set from an rx_time tag
       bool initialized = 0;   // flag initializing output
-      double bufferdelay = float(MAX_VLEN/2)*1.E-6/d_bw;
+      log_ring *d_log = NULL; // messages printed outside the work thread
+      shard_pool *d_pool = NULL; // worker threads, if more than one
+      float *d_monitor = NULL;// monitor port records, if connected
+      int d_nmon = 0;         // monitor records written in this call
+      int d_monvectors = 1;   // input vectors in each monitor interval
+      int d_mvectors = 0;     // input vectors so far in this interval
+      long d_mcount = 0;      // samples so far in this interval
+      double d_msum2 = 0;     // sum of their magnitudes squared
+      float d_mpeak2 = 0;     // peak magnitude squared in the interval
+      long d_mpeakat = 0;     // and its sample, from the interval start
+      int d_mevents = 0;      // events found in the interval
+      bool d_histogram = false; // keep a histogram of magnitudes squared
+      float d_target = 0;     // target event rate (1/s); 0: fixed n sigma
+      uint32_t d_hcount[HIST_BINS]; // samples in each bin this second
+      float d_hist[HIST_BINS];      // decaying histogram of all seconds
+      long d_hsamples = 0;    // samples counted this second
+      double d_hseconds = 0;  // seconds the decayed histogram holds
+      boost::mutex d_hlock;   // guards d_hist
+      gr_complex *d_clean = NULL; // cleaned stream port, if connected
+      float d_blank2 = 0;     // blanking n sigma squared; 0: no blanking
+      int d_nguard = 0;       // samples blanked each side of an impulse
+      bool d_blank_noise = false; // fill blanked samples with noise
+      gr::random d_rng;       // noise for blanked samples
+      uint64_t d_nblanked = 0;  // samples blanked so far
+      uint64_t d_nimpulses = 0; // samples above the blanking threshold
+      std::vector<power_block> d_plan; // blocks filled in this call
+      float *d_power = NULL;  // magnitudes squared of this call's samples
+      long d_npower = 0;      // size of d_power
+      int d_nbin = 0;         // samples in each coarse bin; 0: no bins
+      std::vector<double> d_bins; // running sums of the coarse bins
+      uint64_t d_nevents = 0; // events found so far
+      double d_lastmjd = 0;   // MJD of the last event
+      double d_event_seconds = 0; // seconds spent in event() so far
+      float d_stats_interval = 0; // seconds between stats messages
+      std::chrono::steady_clock::time_point d_stats_last; // last message
+      double bufferdelay = float(d_post)*1.E-6/d_bw;
       
      public:
-      detect_impl(int vec_length,float dms, float f_obs, float bw, float t_int, int nt);
+      detect_impl(int vec_length,float dms, float f_obs, float bw, float t_int, int nt,
+		  int pre_trigger, int post_trigger, int input_type,
+		  int nthreads, int ninputs);
       ~detect_impl();
 
       // Where all the action really happens
@@ -108,10 +234,195 @@ namespace gr {
       void set_mode( int nt);
 
       void set_vlen( int vec_length);
+
+      //      set the running noise window length, in samples
+      void set_noise_window( int nwindow);
+
+      //      set the rms used until the noise window is full
+      void set_noise_rms( float rms0);
       
-      int update_buffer();
+      //      set the MJD of the first sample; 0 uses rx_time or the clock
+      void set_start_time( double mjd);
+
+      //      set the number of samples below threshold that end a burst
+      void set_merge_gap( int ngap);
+
+      //      set the number of samples after a burst before the next event
+      void set_holdoff( int nholdoff);
+
+      //      set the widest boxcar searched, in samples
+      void set_max_width( int maxwidth);
+
+      //      set the sigma tiers used to classify events
+      void set_tiers( const std::vector<float> &tiers);
+
+      // number of tiers crossed by an event of mean power peak2 in a
+      // boxcar width samples wide
+      int tier(float peak2, int width);
+
+      //      set the samples in each monitor record
+      void set_monitor_interval( int ninterval);
+
+      // add the block just written at inext to the monitor interval
+      void monitor_block(float blocksum2, long n);
+
+      // write the monitor record for this interval and start the next
+      void monitor_record();
+
+      //      keep a histogram of magnitudes squared
+      void set_histogram( bool enable);
+
+      //      adjust n sigma for a target event rate; 0 for fixed n sigma
+      void set_target_rate( float rate);
+
+      std::vector<float> get_histogram();
+
+      std::vector<float> get_histogram_edges();
+
+      // lower edge of histogram bin ibin
+      static float bin_edge(int ibin);
+
+      // add the block of n magnitudes squared at inext to the histogram
+      void histogram_block(long n);
+
+      // fold this second into the histogram and adapt n sigma
+      void histogram_update();
+
+      //      set the n sigma above which samples are blanked; 0: off
+      void set_blank_sigma( float nsigma_blank);
+
+      //      set the samples blanked on each side of an impulse
+      void set_blank_guard( int nguard);
+
+      //      fill blanked samples with noise, or zeros
+      void set_blank_noise( bool noise);
+
+      uint64_t get_blanked() { return d_nblanked; }
+
+      uint64_t get_impulses() { return d_nimpulses; }
+
+      // the search trails the samples received by the post trigger samples
+      uint64_t get_samples() { return uint64_t(d_nscan + d_post); }
+
+      uint64_t get_events() { return d_nevents; }
+
+      float get_rms() { return rms; }
+
+      float get_threshold() { return sqrt(nsigma_rms); }
+
+      double get_last_mjd() { return d_lastmjd; }
+
+      double get_event_seconds() { return d_event_seconds; }
 
-      int event(const gr_complex *input, gr_complex *output);
+      //      set the seconds between stats messages; 0: none
+      void set_stats_interval( float seconds);
+
+      // publish the counters above as a dictionary on the stats port
+      void publish_stats();
+
+      // write the cleaned copy of n searched samples at iscan
+      void blank_block(long iscan, long n, gr_complex *clean);
+
+      //      set the most samples between peaks in the two inputs
+      void set_coincidence_window( int ncoinc);
+
+      // samples searches read before their start in the buffers
+      void update_lookback();
+
+      // samples written before the search start that are not yet
+      // overwritten: the pre trigger samples plus boxcar headroom
+      long history() { return d_nbuff - d_nblock - d_post; }
+
+      // copy n samples of the second input into its buffers at inext
+      void fill_second(const char *input, long n);
+
+      // true if the second input is above threshold near ipeak
+      bool coincident(long ipeak);
+
+      // find_event(), skipping events not in the second input
+      long find_trigger(long istart, long n);
+
+      //      set the samples in each bin of the coarse first stage
+      void set_coarse_bin( int nbin);
+
+      //      set the least severe message printed
+      void set_log_level( int level);
+
+      // true if samples above threshold are grouped into bursts
+      bool clustering() const { return (d_ngap > 0) || (d_nholdoff > 0); }
+
+      // copy the event at index ipeak out of the circular buffer
+      int update_buffer(long ipeak, gr_complex *event);
+
+      // convert n input samples to complex float
+      void to_complex(gr_complex *output, const char *input, long n);
+
+      // magnitude squared of n input samples, returning their sum
+      float magnitude2(float *output, const char *input, long n);
+
+      // list the blocks event() fills for nvectors input vectors
+      void plan_blocks(int nvectors);
+
+      // magnitudes squared and sums for shard ishard of the blocks
+      void power_shard(const char *input, int ishard, int nshards);
+
+      // copy the latest capture length samples to output
+      void latest(gr_complex *output);
+
+      // sum of n values in circular2, starting at istart
+      double sum_ring(long istart, long n);
+
+      // update the running noise window after writing n samples at inext
+      void update_window(float blocksum2, long n);
+
+      // index of first sample above threshold in circular2, or -1
+      long find_peak(long istart, long n);
+
+      // index of the center of the best boxcar crossing its threshold
+      // among boxcars ending in n samples at istart, or -1.  After a
+      // crossing, boxcars ending up to last samples after istart are
+      // compared to find the best width; only centers up to inext2,
+      // whose capture is already written, are kept.  d_boxend is set
+      // to the index of the last sample of the winning boxcar.
+      long find_boxcar(long istart, long n, long last);
+
+      // find_peak() or find_boxcar(), run only where sums of coarse
+      // bins of power show a sample or boxcar could cross threshold
+      long find_coarse(long istart, long n);
+
+      // true if a boxcar ending in coarse bin b could cross threshold
+      bool coarse_flag(long b, const int *span, const double *thresh);
+
+      // thresholds for each boxcar width, for the current nsigma
+      void set_box_thresholds();
+
+      // log of the probability a sum of w white noise powers, in units
+      // of their mean, exceeds t
+      double log_erlang_tail(int w, double t);
+
+      // find_peak() or find_boxcar(), setting the peak power d_peak2
+      long find_event(long istart, long n);
+
+      // tag output vector k with an event of peak squared peak2 at
+      // sample number isample; in events mode, k is the queued event
+      void tag_event(int k, float peak2, long long isample);
+
+      // add one event tag to output vector k, or to queued event k
+      void event_tag(int k, const char *key, const pmt::pmt_t &value);
+
+      // tag the event and, in events mode, queue it for output
+      void output_event(int k, float peak2, long long isample);
+
+      // output queued events while there is room in the nvectors outputs
+      void deliver(gr_complex *output, int &nout, int nvectors);
+
+      // group samples above threshold in n samples at iscan into bursts
+      void cluster(long iscan, long n, int k);
+
+      // process up to nvectors input vectors, returning the number used;
+      // nout is the number of output vectors written
+      int event(const char *input, const char *inputB, gr_complex *output,
+		int nvectors, int &nout);
 
       int general_work(int noutput_items,
            gr_vector_int &ninput_items,
@@ -125,6 +436,18 @@ namespace gr {
       int ymd_to_mjd_x(int year, int month, int day);      
 
       double get_mjd();
+
+      // time sample number isample was MJD day + seconds/86400
+      void set_time(int day, double seconds, long long isample);
+
+      // time the next sample from the clock, less the sample delay
+      void set_time_now();
+
+      // time samples from an rx_time tag
+      void set_time_tag(const gr::tag_t &tag);
+
+      // MJD of sample number isample
+      double sample_mjd(long long isample);
     }; 
   } // namespace radio_astro
 } // namespace gr
@@ -0,0 +1,98 @@
+/* -*- c++ -*- */
+/* 
+ * Copyright 2019 - Quiet Skies LLC -- Glen Langston - glen.i.langston@gmail.com
+ * 
+ * This is free software;  you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 3, or (at your option)
+ * any later version.
+ * 
+ * This software is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ * 
+ * You should have received a copy of the GNU General Public License
+ * along with this software; see the file COPYING.  If not, write to
+ * the Free Software Foundation, Inc., 51 Franklin Street,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#ifdef HAVE_CONFIG_H
+#include "config.h"
+#endif
+
+#ifndef _GNU_SOURCE
+#define _GNU_SOURCE             // for memfd_create()
+#endif
+
+#include "double_mapped_ring.h"
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <stdio.h>
+#include <stdexcept>
+
+namespace gr {
+  namespace radio_astro {
+
+    size_t
+    double_mapped_ring::pagesize()
+    {
+      return (size_t) sysconf(_SC_PAGESIZE);
+    }
+
+    double_mapped_ring::double_mapped_ring(size_t nbytes)
+      : d_nbytes(nbytes)
+    { int fd = -1;
+      void *base = MAP_FAILED, *first = MAP_FAILED, *second = MAP_FAILED;
+
+      if ((nbytes == 0) || (nbytes % pagesize() != 0))
+	throw std::invalid_argument(
+	  "double_mapped_ring: size must be a multiple of the page size");
+
+      // anonymous shared memory to map twice
+#ifdef MFD_CLOEXEC
+      fd = memfd_create("radio_astro_ring", MFD_CLOEXEC);
+#else
+      char name[64];
+      snprintf(name, sizeof name, "/radio_astro_ring_%d_%p",
+	       (int) getpid(), (void *) this);
+      fd = shm_open(name, O_RDWR | O_CREAT | O_EXCL, S_IRUSR | S_IWUSR);
+      if (fd >= 0)
+	shm_unlink(name);      // freed when the mappings are removed
+#endif
+      if (fd < 0)
+	throw std::runtime_error("double_mapped_ring: can not create memory");
+      if (ftruncate(fd, nbytes) != 0)
+	{ close(fd);
+	  throw std::runtime_error("double_mapped_ring: can not size memory");
+	}
+
+      // reserve address space for both copies, then map the memory twice
+      base = mmap(NULL, 2*nbytes, PROT_NONE, MAP_PRIVATE | MAP_ANONYMOUS,
+		  -1, 0);
+      if (base != MAP_FAILED)
+	{ first = mmap(base, nbytes, PROT_READ | PROT_WRITE,
+		       MAP_SHARED | MAP_FIXED, fd, 0);
+	  second = mmap((char *) base + nbytes, nbytes,
+			PROT_READ | PROT_WRITE, MAP_SHARED | MAP_FIXED, fd, 0);
+	}
+      close(fd);               // the mappings keep the memory
+      if ((base == MAP_FAILED) || (first != base) ||
+	  (second != (char *) base + nbytes))
+	{ if (base != MAP_FAILED)
+	    munmap(base, 2*nbytes);
+	  throw std::runtime_error("double_mapped_ring: can not map memory");
+	}
+      d_base = (char *) base;
+    } // end of double_mapped_ring()
+
+    double_mapped_ring::~double_mapped_ring()
+    {
+      munmap(d_base, 2*d_nbytes);
+    }
+
+  } /* namespace radio_astro */
+} /* namespace gr */
@@ -0,0 +1,56 @@
+/* -*- c++ -*- */
+/* 
+ * Copyright 2019 - Quiet Skies LLC -- Glen Langston - glen.i.langston@gmail.com
+ * 
+ * This is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 3, or (at your option)
+ * any later version.
+ * 
+ * This software is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ * 
+ * You should have received a copy of the GNU General Public License
+ * along with this software; see the file COPYING.  If not, write to
+ * the Free Software Foundation, Inc., 51 Franklin Street,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#ifndef INCLUDED_RADIO_ASTRO_DOUBLE_MAPPED_RING_H
+#define INCLUDED_RADIO_ASTRO_DOUBLE_MAPPED_RING_H
+
+#include <stddef.h>
+
+namespace gr {
+  namespace radio_astro {
+
+    /*
+     * Circular buffer memory mapped twice, back to back, so that
+     * data()[i] and data()[i + nbytes] are the same byte.  Any window
+     * up to nbytes long starting inside the buffer is contiguous.
+     * nbytes must be a multiple of the page size.
+     */
+    class double_mapped_ring
+    {
+     private:
+      char *d_base = NULL;    // start of the first of the two mappings
+      size_t d_nbytes = 0;    // length of one mapping
+
+     public:
+      double_mapped_ring(size_t nbytes);
+      ~double_mapped_ring();
+
+      void *data() const { return d_base; }
+
+      size_t size() const { return d_nbytes; }
+
+      // memory page size; buffer lengths must be a multiple of this
+      static size_t pagesize();
+    };
+
+  } // namespace radio_astro
+} // namespace gr
+
+#endif /* INCLUDED_RADIO_ASTRO_DOUBLE_MAPPED_RING_H */
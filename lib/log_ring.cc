@@ -0,0 +1,178 @@
+/* -*- c++ -*- */
+/* 
+ * Copyright 2019 - Quiet Skies LLC -- Glen Langston - glen.i.langston@gmail.com
+ * 
+ * This is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 3, or (at your option)
+ * any later version.
+ * 
+ * This software is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ * 
+ * You should have received a copy of the GNU General Public License
+ * along with this software; see the file COPYING.  If not, write to
+ * the Free Software Foundation, Inc., 51 Franklin Street,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#ifdef HAVE_CONFIG_H
+#include "config.h"
+#endif
+
+#include "log_ring.h"
+#include <stdio.h>
+#include <time.h>
+#include <sched.h>
+#include <pthread.h>
+
+namespace gr {
+  namespace radio_astro {
+
+    static double
+    now_seconds()
+    {
+      struct timespec ts;
+      clock_gettime(CLOCK_MONOTONIC, &ts);
+      return double(ts.tv_sec) + 1.E-9*double(ts.tv_nsec);
+    }
+
+    log_ring::log_ring()
+    {
+      for (int iq = 0; iq < 2; iq++) {
+	d_queue[iq].head = 0;
+	d_queue[iq].tail = 0;
+	d_queue[iq].dropped = 0;
+      }
+      d_level = INFO;
+      d_limited = 0;
+      d_done = false;
+      d_last = now_seconds();
+      d_thread = new boost::thread(&log_ring::run, this);
+    } // end of log_ring()
+
+    log_ring::~log_ring()
+    {
+      d_done = true;
+      d_thread->join();
+      delete d_thread;
+      drain();               // anything queued while stopping
+    }
+
+    void
+    log_ring::set_level(int level)
+    {
+      if (level < DEBUG)
+	level = DEBUG;
+      else if (level > ERROR)
+	level = ERROR;
+      d_level = level;
+    } // end of set_level()
+
+    void
+    log_ring::push(int iq, const char *format, va_list args)
+    {
+      queue &q = d_queue[iq];
+      unsigned tail = q.tail.load(std::memory_order_relaxed);
+      unsigned next = (tail + 1) % LOG_SLOTS;
+
+      if (next == q.head.load(std::memory_order_acquire)) {
+	q.dropped++;           // printing thread is behind
+	return;
+      }
+      vsnprintf(q.slots[tail].text, LOG_TEXT, format, args);
+      q.tail.store(next, std::memory_order_release);
+    } // end of push()
+
+    void
+    log_ring::work(int level, const char *format, ...)
+    {
+      if (level < d_level)
+	return;
+
+      // token bucket: LOG_RATE messages per second, in bursts up to
+      // one second worth; errors are always queued
+      double now = now_seconds();
+      d_tokens += (now - d_last)*LOG_RATE;
+      d_last = now;
+      if (d_tokens > LOG_RATE)
+	d_tokens = LOG_RATE;
+      if (level < ERROR) {
+	if (d_tokens < 1.) {
+	  d_limited++;
+	  return;
+	}
+	d_tokens -= 1.;
+      }
+
+      va_list args;
+      va_start(args, format);
+      push(0, format, args);
+      va_end(args);
+    } // end of work()
+
+    void
+    log_ring::setting(const char *format, ...)
+    {
+      if (INFO < d_level)
+	return;
+
+      va_list args;
+      va_start(args, format);
+      push(1, format, args);
+      va_end(args);
+    } // end of setting()
+
+    int
+    log_ring::drain()
+    {
+      int nprint = 0;
+
+      for (int iq = 1; iq >= 0; iq--) {  // settings first
+	queue &q = d_queue[iq];
+	unsigned head = q.head.load(std::memory_order_relaxed);
+	unsigned tail = q.tail.load(std::memory_order_acquire);
+
+	while (head != tail) {
+	  fputs(q.slots[head].text, stdout);
+	  head = (head + 1) % LOG_SLOTS;
+	  q.head.store(head, std::memory_order_release);
+	  nprint++;
+	}
+
+	long ndrop = q.dropped.exchange(0);
+	if (ndrop > 0) {
+	  printf("Log full, %ld messages dropped\n", ndrop);
+	  nprint++;
+	}
+      }
+
+      long nlimit = d_limited.exchange(0);
+      if (nlimit > 0) {
+	printf("Log rate limit, %ld messages dropped\n", nlimit);
+	nprint++;
+      }
+      if (nprint > 0)
+	fflush(stdout);
+      return nprint;
+    } // end of drain()
+
+    void
+    log_ring::run()
+    {
+#ifdef SCHED_IDLE
+      // printing is the least urgent thing in the flowgraph
+      struct sched_param param;
+      param.sched_priority = 0;
+      pthread_setschedparam(pthread_self(), SCHED_IDLE, &param);
+#endif
+      while (!d_done) {
+	if (drain() == 0)
+	  boost::this_thread::sleep(boost::posix_time::milliseconds(50));
+      }
+    } // end of run()
+
+  } /* namespace radio_astro */
+} /* namespace gr */
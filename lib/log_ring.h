@@ -0,0 +1,96 @@
+/* -*- c++ -*- */
+/* 
+ * Copyright 2019 - Quiet Skies LLC -- Glen Langston - glen.i.langston@gmail.com
+ * 
+ * This is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 3, or (at your option)
+ * any later version.
+ * 
+ * This software is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ * 
+ * You should have received a copy of the GNU General Public License
+ * along with this software; see the file COPYING.  If not, write to
+ * the Free Software Foundation, Inc., 51 Franklin Street,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#ifndef INCLUDED_RADIO_ASTRO_LOG_RING_H
+#define INCLUDED_RADIO_ASTRO_LOG_RING_H
+
+#include <stdarg.h>
+#include <atomic>
+#include <boost/thread/thread.hpp>
+
+#define LOG_SLOTS 256        // messages held waiting to be printed
+#define LOG_TEXT  128        // longest message, including the end of string
+#define LOG_RATE  20.        // most work messages printed per second
+
+namespace gr {
+  namespace radio_astro {
+
+    /*
+     * Messages for the terminal, formatted in the calling thread and
+     * printed by a low priority thread, so the work thread never waits
+     * on the terminal.  There are two single producer, single consumer
+     * queues: work() messages come from the work thread and are rate
+     * limited; setting() messages come from the setters.  When a queue
+     * is full, or the rate is exceeded, messages are counted and dropped.
+     */
+    class log_ring
+    {
+     public:
+      enum { DEBUG = 0, INFO = 1, WARN = 2, ERROR = 3 };
+
+     private:
+      struct entry {
+	char text[LOG_TEXT];
+      };
+
+      struct queue {
+	entry slots[LOG_SLOTS];
+	std::atomic<unsigned> head;  // next slot to print
+	std::atomic<unsigned> tail;  // next slot to fill
+	std::atomic<long> dropped;   // messages lost to a full queue
+      };
+
+      queue d_queue[2];            // work thread and setter messages
+      std::atomic<int> d_level;    // least severe level printed
+      double d_tokens = LOG_RATE;  // work messages allowed now
+      double d_last = 0;           // time tokens were last counted (s)
+      std::atomic<long> d_limited; // work messages over the rate limit
+      std::atomic<bool> d_done;
+      boost::thread *d_thread = NULL;
+
+      void push(int iq, const char *format, va_list args);
+
+      // print all waiting messages; returns the number printed
+      int drain();
+
+      // body of the low priority printing thread
+      void run();
+
+     public:
+      log_ring();
+      ~log_ring();
+
+      // message from the work thread; never blocks
+      void work(int level, const char *format, ...)
+	__attribute__ ((format (printf, 3, 4)));
+
+      // message from a setter, not rate limited
+      void setting(const char *format, ...)
+	__attribute__ ((format (printf, 2, 3)));
+
+      // messages less severe than level are not printed
+      void set_level(int level);
+      int level() const { return d_level; }
+    };
+
+  } // namespace radio_astro
+} // namespace gr
+
+#endif /* INCLUDED_RADIO_ASTRO_LOG_RING_H */
@@ -0,0 +1,98 @@
+/* -*- c++ -*- */
+/* 
+ * Copyright 2019 - Quiet Skies LLC -- Glen Langston - glen.i.langston@gmail.com
+ * 
+ * This is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 3, or (at your option)
+ * any later version.
+ * 
+ * This software is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ * 
+ * You should have received a copy of the GNU General Public License
+ * along with this software; see the file COPYING.  If not, write to
+ * the Free Software Foundation, Inc., 51 Franklin Street,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#ifdef HAVE_CONFIG_H
+#include "config.h"
+#endif
+
+#include "shard_pool.h"
+
+namespace gr {
+  namespace radio_astro {
+
+    shard_pool::shard_pool(int nworkers)
+    {
+      for (int i = 0; i < nworkers; i++)
+	d_threads.push_back(new boost::thread(&shard_pool::run_worker, this));
+    } // end of shard_pool()
+
+    shard_pool::~shard_pool()
+    {
+      {
+	boost::mutex::scoped_lock lock(d_mutex);
+	d_quit = true;
+      }
+      d_start.notify_all();
+      for (unsigned i = 0; i < d_threads.size(); i++)
+	{ d_threads[i]->join();
+	  delete d_threads[i];
+	}
+    }
+
+    void
+    shard_pool::work_shards(boost::mutex::scoped_lock &lock)
+    {
+      while (d_next < d_nshards)
+	{ int ishard = d_next++;
+	  d_busy++;
+	  lock.unlock();
+	  d_task(ishard);
+	  lock.lock();
+	  d_busy--;
+	}
+      if ((d_busy == 0) && (d_next >= d_nshards))
+	d_done.notify_all();
+    } // end of work_shards()
+
+    void
+    shard_pool::run_worker()
+    {
+      boost::mutex::scoped_lock lock(d_mutex);
+      long generation = d_generation;
+
+      while (true)
+	{ while ((! d_quit) && (generation == d_generation))
+	    d_start.wait(lock);
+	  if (d_quit)
+	    return;
+	  generation = d_generation;
+	  work_shards(lock);
+	}
+    } // end of run_worker()
+
+    void
+    shard_pool::run(int nshards, const boost::function<void (int)> &task)
+    {
+      boost::mutex::scoped_lock lock(d_mutex);
+
+      d_task = task;
+      d_nshards = nshards;
+      d_next = 0;
+      d_busy = 0;
+      d_generation++;
+      d_start.notify_all();
+
+      work_shards(lock);
+      while ((d_busy > 0) || (d_next < d_nshards))
+	d_done.wait(lock);
+    } // end of run()
+
+  } /* namespace radio_astro */
+} /* namespace gr */
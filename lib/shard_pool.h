@@ -0,0 +1,72 @@
+/* -*- c++ -*- */
+/* 
+ * Copyright 2019 - Quiet Skies LLC -- Glen Langston - glen.i.langston@gmail.com
+ * 
+ * This is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 3, or (at your option)
+ * any later version.
+ * 
+ * This software is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ * 
+ * You should have received a copy of the GNU General Public License
+ * along with this software; see the file COPYING.  If not, write to
+ * the Free Software Foundation, Inc., 51 Franklin Street,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#ifndef INCLUDED_RADIO_ASTRO_SHARD_POOL_H
+#define INCLUDED_RADIO_ASTRO_SHARD_POOL_H
+
+#include <vector>
+#include <boost/function.hpp>
+#include <boost/thread/thread.hpp>
+#include <boost/thread/mutex.hpp>
+#include <boost/thread/condition_variable.hpp>
+
+namespace gr {
+  namespace radio_astro {
+
+    /*
+     * Worker threads that run one task on numbered shards of work.
+     * The calling thread works too, and run() returns once every
+     * shard is done.  Only one thread may call run().
+     */
+    class shard_pool
+    {
+     private:
+      std::vector<boost::thread *> d_threads;
+      boost::mutex d_mutex;
+      boost::condition_variable d_start;  // a new task, or quit
+      boost::condition_variable d_done;   // the last shard finished
+      boost::function<void (int)> d_task;
+      int d_nshards = 0;      // shards in the current task
+      int d_next = 0;         // next shard to start
+      int d_busy = 0;         // shards started but not finished
+      long d_generation = 0;  // count of tasks started
+      bool d_quit = false;
+
+      // run shards of the current task until none are left
+      void work_shards(boost::mutex::scoped_lock &lock);
+
+      // body of each worker thread
+      void run_worker();
+
+     public:
+      shard_pool(int nworkers);
+      ~shard_pool();
+
+      // threads working on each task, including the caller
+      int size() const { return int(d_threads.size()) + 1; }
+
+      // call task(i) for i = 0 ... nshards-1, spread over all threads
+      void run(int nshards, const boost::function<void (int)> &task);
+    };
+
+  } // namespace radio_astro
+} // namespace gr
+
+#endif /* INCLUDED_RADIO_ASTRO_SHARD_POOL_H */
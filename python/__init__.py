@@ -40,6 +40,8 @@ from ra_integrate import ra_integrate
 from ra_vave import ra_vave
 from ra_ascii_sink import ra_ascii_sink
 from ra_vmedian import ra_vmedian
+from ra_spectral_event import ra_spectral_event
+from ra_kevent import ra_kevent
 from systemp_calibration import systemp_calibration
 
 #
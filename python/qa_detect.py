@@ -1,41 +1,425 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-# 
-# Copyright 2018 <+YOU OR YOUR COMPANY+>.
-# 
+#
+# Copyright 2019 Quiet Skies LLC
+#
 # This is free software; you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation; either version 3, or (at your option)
 # any later version.
-# 
+#
 # This software is distributed in the hope that it will be useful,
 # but WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
-# 
+#
 # You should have received a copy of the GNU General Public License
 # along with this software; see the file COPYING.  If not, write to
 # the Free Software Foundation, Inc., 51 Franklin Street,
 # Boston, MA 02110-1301, USA.
-# 
+#
+# History
+# 19MAR15 GIL flow graph tests of each detect feature
+# 19MAR15 GIL captures of impulses and of wide boxcar events
 
+import numpy as np
 from gnuradio import gr, gr_unittest
 from gnuradio import blocks
+import pmt
 import radio_astro_swig as radio_astro
 
-class qa_detect (gr_unittest.TestCase):
+VLEN = 1024
+NSIGMA = 6.
+BW = 6.                 # MHz
+MODE_DETECT = 2
+MODE_EVENTS = 3
+
+def noise(rng, ns):
+    # complex noise, rms 1 in each of I and Q, sqrt(2) in amplitude
+    return (rng.normal(size=ns) + 1j*rng.normal(size=ns)).astype(
+        np.complex64)
+
+def tag_values(snk, key):
+    """
+    tag_values() returns the (offset, value) of the sink tags with key
+    """
+    values = []
+    for tag in snk.tags():
+        if pmt.symbol_to_string(tag.key) == key:
+            values.append((tag.offset, pmt.to_python(tag.value)))
+    return sorted(values)
 
+def find_slice(inn, capture):
+    """
+    find_slice() returns where the capture starts in the input, or -1
+    if the capture is not a contiguous slice of the input
+    """
+    for i in np.nonzero(inn == capture[0])[0]:
+        if np.array_equal(inn[i:i+len(capture)], capture):
+            return i
+    return -1
+
+class qa_detect (gr_unittest.TestCase):
+    """
+    qa_detect runs the detect block in flow graphs, on noise with
+    impulses and bursts at known samples, and checks its tags and
+    captures
+    """
     def setUp (self):
         self.tb = gr.top_block ()
 
     def tearDown (self):
         self.tb = None
 
-    def test_001_t (self):
-        # set up fg
-        self.tb.run ()
-        # check data
+    def make(self, nt=MODE_EVENTS, pre=512, post=512, vlen=VLEN,
+             itype=0, nthreads=1, ninputs=1):
+        det = radio_astro.detect(vlen, NSIGMA, 1420., BW, 0., nt,
+                                 pre, post, itype, nthreads, ninputs)
+        det.set_log_level(2)
+        return det
+
+    def run_detect(self, det, inn, ncapture, vlen=VLEN, maxn=None,
+                   src=None, tags=(), inb=None, monitor=None, clean=None):
+        """
+        run_detect() runs the input samples through det into a sink of
+        captures, one vector per call if maxn is 1, and returns the sink.
+        The optional second input and monitor and clean sinks are
+        connected if given.
+        """
+        if src is None:
+            src = blocks.vector_source_c(inn.tolist(), False, vlen,
+                                         list(tags))
+        snk = blocks.vector_sink_c(ncapture)
+        self.tb.connect(src, det, snk)
+        if inb is not None:
+            self.tb.connect(blocks.vector_source_c(inb.tolist(), False, vlen),
+                            (det, 1))
+        if monitor is not None:
+            self.tb.connect((det, 1), monitor)
+        if clean is not None:
+            self.tb.connect((det, 2), clean)
+        if maxn is None:
+            self.tb.run()
+        else:
+            self.tb.run(maxn)
+        return snk
+
+    def check_captures(self, inn, snk, ncapture):
+        """
+        check_captures() checks each capture is a slice of the input and
+        returns where they start
+        """
+        captures = np.array(snk.data()).reshape(-1, ncapture)
+        starts = [find_slice(inn, capture) for capture in captures]
+        self.assertTrue(min(starts + [0]) >= 0)
+        return starts
+
+    def test_001_capture(self):
+        # impulses far apart, each captured around its sample
+        rng = np.random.RandomState(1)
+        inn = noise(rng, 64*VLEN)
+        impulses = np.arange(6, 64, 6)*VLEN + 300
+        inn[impulses] = 30.
+        det = self.make(pre=256, post=768)
+        snk = self.run_detect(det, inn, 1024)
+        starts = self.check_captures(inn, snk, 1024)
+        self.assertEqual(starts, list(impulses - 256))
+        peaks = tag_values(snk, 'PEAK')
+        self.assertEqual([offset for (offset, peak) in peaks],
+                         range(len(impulses)))
+        for (offset, peak) in peaks:
+            self.assertAlmostEqual(peak, 30., 4)
+
+    def test_002_wide_capture(self):
+        # bursts too weak for single samples, found by wide boxcars,
+        # whose centers can be before the search start.  With no pre
+        # trigger samples and a long post trigger, the captures must
+        # still be intact slices of the input
+        vlen = 4096
+        rng = np.random.RandomState(2)
+        inn = noise(rng, 48*vlen)
+        bursts = np.cumsum(rng.randint(1000, 5000, 60))
+        for burst in bursts:
+            inn[burst:burst+rng.randint(100, 250)] += 3.
+        det = self.make(pre=0, post=4096, vlen=vlen)
+        det.set_max_width(256)
+        snk = self.run_detect(det, inn, 4096, vlen)
+        starts = self.check_captures(inn, snk, 4096)
+        self.assertTrue(len(starts) >= 15)
+        boxcars = [width for (offset, width) in tag_values(snk, 'BOXCAR')]
+        self.assertTrue(max(boxcars) >= 64)
+
+    def impulses(self, seed, nv, impulses, vlen=VLEN, amplitude=30.):
+        rng = np.random.RandomState(seed)
+        inn = noise(rng, nv*vlen)
+        inn[impulses] = amplitude
+        return inn
+
+    def test_003_batches(self):
+        # the same events whether work() gets one vector or many
+        impulses = np.arange(4, 60, 5)*VLEN + 700
+        inn = self.impulses(3, 64, impulses)
+        for maxn in (1, None):
+            self.tb = gr.top_block()
+            det = self.make()
+            snk = self.run_detect(det, inn, 1024, maxn=maxn)
+            starts = self.check_captures(inn, snk, 1024)
+            self.assertEqual(starts, list(impulses - 512))
+            self.assertEqual(det.get_events(), len(impulses))
+            self.assertEqual(det.get_samples(), len(inn))
+
+    def test_004_noise_window(self):
+        # an impulse in the first vector is found only with a starting
+        # noise estimate, before the buffer first fills
+        inn = self.impulses(4, 16, [300])
+        det = self.make(pre=256, post=256)
+        snk = self.run_detect(det, inn, 512)
+        self.assertEqual(len(snk.data()), 0)
+        self.tb = gr.top_block()
+        det = self.make(pre=256, post=256)
+        det.set_noise_window(4096)
+        det.set_noise_rms(np.sqrt(2.))
+        snk = self.run_detect(det, inn, 512)
+        self.assertEqual(self.check_captures(inn, snk, 512), [300 - 256])
+        self.assertAlmostEqual(det.get_rms()/np.sqrt(2.), 1., 1)
+
+    def test_005_geometry(self):
+        # pre and post trigger samples set the capture length and where
+        # the peak is; with neither, a vector centered on the peak
+        impulses = np.arange(4, 30, 5)*VLEN + 100
+        inn = self.impulses(5, 32, impulses)
+        for (pre, post, ncapture) in ((100, 300, 400), (0, 0, VLEN)):
+            self.tb = gr.top_block()
+            det = self.make(pre=pre, post=post)
+            snk = self.run_detect(det, inn, ncapture)
+            starts = self.check_captures(inn, snk, ncapture)
+            if pre + post == 0:
+                pre = VLEN//2
+            self.assertEqual(starts, list(impulses - pre))
+            captures = np.array(snk.data()).reshape(-1, ncapture)
+            self.assertTrue(np.all(captures[:, pre] == 30.))
+
+    def test_006_events_mode(self):
+        # in detect mode every input vector gives an output, the last
+        # capture; in events mode only events do.  Two bursts per input
+        # vector, with room for one output per call, are queued
+        vlen = 16384
+        impulses = np.ravel([[i*vlen + 1000, i*vlen + 12000]
+                             for i in range(2, 7)])
+        inn = self.impulses(6, 8, impulses, vlen)
+        det = self.make(nt=MODE_DETECT, pre=256, post=256, vlen=vlen)
+        snk = self.run_detect(det, inn, 512, vlen)
+        self.assertEqual(len(snk.data()), 8*512)
+        results = []
+        for maxn in (1, None):
+            self.tb = gr.top_block()
+            det = self.make(pre=256, post=256, vlen=vlen)
+            det.set_merge_gap(16)
+            snk = self.run_detect(det, inn, 512, vlen, maxn)
+            self.assertEqual(self.check_captures(inn, snk, 512),
+                             list(impulses - 256))
+            results.append((snk.data(), tag_values(snk, 'PEAK')))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([offset for (offset, peak) in results[0][1]],
+                         range(len(impulses)))
+
+    def test_007_bursts(self):
+        # impulses closer than the merge gap are one event, at the
+        # brightest; the holdoff drops a second burst soon after
+        i = 10*VLEN + 300
+        inn = self.impulses(7, 32, [])
+        inn[[i, i + 10, i + 20, i + 2000]] = [20., 30., 25., 30.]
+        for (holdoff, nevents) in ((0, 2), (5000, 1)):
+            self.tb = gr.top_block()
+            det = self.make()
+            det.set_merge_gap(16)
+            det.set_holdoff(holdoff)
+            snk = self.run_detect(det, inn, 1024)
+            starts = self.check_captures(inn, snk, 1024)
+            self.assertEqual(starts, [i + 10 - 512, i + 2000 - 512][0:nevents])
+            for (key, value) in (('PEAKINDEX', i + 10), ('START', i),
+                                 ('STOP', i + 20), ('WIDTH', 21)):
+                self.assertEqual(tag_values(snk, key)[0], (0, value))
+            # the power of the three impulses, and of noise between them
+            fluence = tag_values(snk, 'FLUENCE')[0][1]
+            self.assertTrue(abs(fluence - 1925.) < 100.)
+
+    def test_008_timing(self):
+        # event times follow the rx_time tag, or the start time
+        impulses = np.arange(4, 30, 5)*VLEN + 100
+        inn = self.impulses(8, 32, impulses)
+        rx_time = gr.tag_t()
+        rx_time.offset = 2
+        rx_time.key = pmt.intern('rx_time')
+        rx_time.value = pmt.make_tuple(pmt.from_uint64(1552608000),
+                                       pmt.from_double(0.25))
+        det = self.make()
+        snk = self.run_detect(det, inn, 1024, tags=[rx_time])
+        mjds = tag_values(snk, 'MJD')
+        self.assertEqual(len(mjds), len(impulses))
+        for ((offset, mjd), i) in zip(mjds, impulses):
+            seconds = 0.25 + (i - 2*VLEN)/(BW*1.E6)
+            self.assertAlmostEqual((mjd - 58557.)*86400., seconds, 5)
+        self.tb = gr.top_block()
+        det = self.make()
+        det.set_start_time(58557.5)
+        snk = self.run_detect(det, inn, 1024)
+        for ((offset, mjd), i) in zip(tag_values(snk, 'MJD'), impulses):
+            self.assertAlmostEqual((mjd - 58557.5)*86400., i/(BW*1.E6), 5)
+
+    def test_009_integer_input(self):
+        # sc16 and sc8 samples give the events and captures of the same
+        # values as complex floats
+        impulses = np.arange(4, 30, 5)*VLEN + 100
+        for (itype, scale, dtype) in ((1, 100., np.int16),
+                                      (2, 10., np.int8)):
+            rng = np.random.RandomState(9)
+            inn = np.round(noise(rng, 32*VLEN)*scale)
+            inn[impulses] = 10.*scale*(1. + 1j)
+            ints = np.zeros(2*len(inn), dtype=dtype)
+            ints[0::2] = inn.real
+            ints[1::2] = inn.imag
+            if itype == 1:
+                src = blocks.vector_source_s(ints.tolist(), False, 2*VLEN)
+            else:
+                src = blocks.vector_source_b(ints.view(np.uint8).tolist(),
+                                             False, 2*VLEN)
+            self.tb = gr.top_block()
+            det = self.make(itype=itype)
+            snk = self.run_detect(det, inn, 1024, src=src)
+            self.tb = gr.top_block()
+            ref = self.run_detect(self.make(), inn, 1024)
+            self.assertEqual(self.check_captures(inn, snk, 1024),
+                             list(impulses - 512))
+            self.assertEqual(snk.data(), ref.data())
+
+    def test_010_boxcars(self):
+        # a wide burst too weak for single samples is found by a boxcar
+        # as wide as it; an impulse by single samples
+        i = 10*VLEN + 300
+        inn = self.impulses(10, 32, [20*VLEN + 300])
+        inn[i:i + 128] += 2.
+        det = self.make()
+        snk = self.run_detect(det, inn, 1024)
+        self.assertEqual(self.check_captures(inn, snk, 1024),
+                         [20*VLEN + 300 - 512])
+        self.assertEqual(tag_values(snk, 'BOXCAR'), [])
+        self.tb = gr.top_block()
+        det = self.make()
+        det.set_max_width(256)
+        snk = self.run_detect(det, inn, 1024)
+        self.check_captures(inn, snk, 1024)
+        boxcars = [boxcar for (offset, boxcar) in tag_values(snk, 'BOXCAR')]
+        self.assertTrue(32 <= boxcars[0] <= 256)
+        self.assertEqual(boxcars[-1], 1)
+
+    def test_011_tiers(self):
+        # each event is tagged with the highest tier its sigma reaches
+        impulses = np.array([5, 10, 15])*VLEN + 100
+        inn = self.impulses(11, 20, [])
+        inn[impulses] = [10., 20., 40.]
+        det = self.make()
+        det.set_tiers([6., 10., 20., 40.])
+        snk = self.run_detect(det, inn, 1024)
+        self.assertEqual([tier for (offset, tier)
+                          in tag_values(snk, 'TIER')], [1, 2, 3])
+
+    def test_012_monitor(self):
+        # a monitor record each interval: rms, peak, peak index, events
+        i = 9*VLEN + 100
+        inn = self.impulses(12, 32, [i])
+        det = self.make()
+        det.set_monitor_interval(2*VLEN)
+        monitor = blocks.vector_sink_f(4)
+        self.run_detect(det, inn, 1024, monitor=monitor)
+        records = np.array(monitor.data()).reshape(-1, 4)
+        self.assertEqual(len(records), 16)
+        self.assertAlmostEqual(records[4][1], 30., 4)
+        self.assertEqual(records[4][2], i - 8*VLEN)
+        self.assertEqual(np.sum(records[:, 3]), 1.)
+        self.assertTrue(np.all(records[:, 1] > 0.))
+        quiet = np.delete(records[:, 0], 4)
+        self.assertTrue(np.all(np.abs(quiet - np.sqrt(2.)) < 0.1))
+
+    def test_013_histogram(self):
+        # a histogram of sample powers over 3 seconds, and with a target
+        # event rate, a threshold set by the noise
+        bw = 0.1                    # MHz, 1E5 samples per second
+        inn = self.impulses(13, 300, [])
+        det = self.make()
+        det.set_bw(bw)
+        det.set_histogram(True)
+        self.run_detect(det, inn, 1024)
+        counts = np.array(det.get_histogram())
+        edges = np.array(det.get_histogram_edges())
+        self.assertEqual(len(edges), len(counts))
+        self.assertTrue(2.E5 < np.sum(counts) <= 3.E5)
+        # half the noise powers are below 2 ln(2), about 1.4; the bin
+        # edges are a quarter octave apart
+        imedian = np.searchsorted(np.cumsum(counts), np.sum(counts)/2.)
+        self.assertTrue(1.1 < edges[imedian] < 1.7)
+        self.assertAlmostEqual(det.get_threshold()/det.get_rms(), NSIGMA, 4)
+        self.tb = gr.top_block()
+        det = self.make()
+        det.set_bw(bw)
+        det.set_target_rate(100.)
+        self.run_detect(det, inn, 1024)
+        # 1 in 1000 samples is above sigma sqrt(ln(1000)), about 2.6
+        self.assertTrue(det.get_threshold() < 4.*det.get_rms())
+        self.assertTrue(det.get_threshold() > 2.*det.get_rms())
+
+    def test_014_blanking(self):
+        # the clean output is the input delayed by the post trigger
+        # samples, with the impulse and its guard samples zeroed
+        i = 20*VLEN + 300
+        inn = self.impulses(14, 32, [i])
+        det = self.make()
+        det.set_blank_sigma(6.)
+        det.set_blank_guard(100)
+        monitor = blocks.vector_sink_f(4)
+        clean = blocks.vector_sink_c(VLEN)
+        self.run_detect(det, inn, 1024, monitor=monitor, clean=clean)
+        expect = np.concatenate((np.zeros(512, dtype=np.complex64),
+                                 inn[0:-512]))
+        expect[i + 512 - 100:i + 512 + 101] = 0.
+        self.assertTrue(np.array_equal(np.array(clean.data()), expect))
+        self.assertEqual(det.get_blanked(), 201)
+        self.assertEqual(det.get_impulses(), 1)
+
+    def test_015_coincidence(self):
+        # an impulse in both inputs, 5 samples apart, is an event only
+        # with a wider coincidence window; the capture is the same
+        # samples of both inputs
+        i = 20*VLEN + 300
+        inn = self.impulses(15, 32, [i])
+        inb = self.impulses(16, 32, [i + 5])
+        for (window, nevents) in ((0, 0), (8, 1)):
+            self.tb = gr.top_block()
+            det = self.make(pre=256, post=256, ninputs=2)
+            det.set_coincidence_window(window)
+            snk = self.run_detect(det, inn, 1024, inb=inb)
+            captures = np.array(snk.data()).reshape(-1, 1024)
+            self.assertEqual(len(captures), nevents)
+        self.assertEqual(find_slice(inn, captures[0][0:512]), i - 256)
+        self.assertEqual(find_slice(inb, captures[0][512:]), i - 256)
 
+    def test_016_threads(self):
+        # the search split over threads, or over coarse bins first,
+        # gives the events of the plain search
+        vlen = 4096
+        rng = np.random.RandomState(16)
+        impulses = np.arange(2, 62, 5)*vlen + rng.randint(0, vlen, 12)
+        inn = self.impulses(17, 64, impulses, vlen)
+        results = []
+        for (nthreads, nbin) in ((1, 0), (4, 0), (1, 64)):
+            self.tb = gr.top_block()
+            det = self.make(vlen=vlen, nthreads=nthreads)
+            det.set_coarse_bin(nbin)
+            snk = self.run_detect(det, inn, 1024, vlen)
+            results.append((snk.data(), tag_values(snk, 'PEAK')))
+        self.assertEqual(len(results[0][1]), len(impulses))
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], results[0])
 
 if __name__ == '__main__':
     gr_unittest.run(qa_detect, "qa_detect.xml")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2019 Quiet Skies LLC
+#
+# This is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+# History
+# 19MAR15 GIL run in a flow graph, not with stand in modules
+# 19MAR14 GIL initial version, impulse, chirp and noise only streams
+
+import numpy as np
+from gnuradio import gr, gr_unittest
+from gnuradio import blocks
+import pmt
+from ra_kevent import ra_kevent
+
+VLEN = 1024
+WINDOW = 256
+NVECTORS = 32
+
+class qa_ra_kevent(gr_unittest.TestCase):
+    """
+    qa_ra_kevent checks kurtosis events are found for an impulse and a
+    chirp, which is not noise like, and not for gaussian noise alone
+    """
+    def setUp(self):
+        self.tb = gr.top_block()
+
+    def tearDown(self):
+        self.tb = None
+
+    def noise(self, seed):
+        rng = np.random.RandomState(seed)
+        ns = NVECTORS*VLEN
+        return (rng.normal(size=ns) + 1j*rng.normal(size=ns)).astype(
+            np.complex64)
+
+    def run_block(self, inn):
+        src = blocks.vector_source_c(inn.tolist())
+        block = ra_kevent(VLEN, WINDOW, 6., 1.E6, 0.)
+        self.snk = blocks.vector_sink_c(VLEN)
+        self.tb.connect(src, block, self.snk)
+        self.tb.run()
+        self.assertEqual(len(self.snk.data()), NVECTORS*VLEN)
+        return block
+
+    def tag_values(self, key):
+        return [pmt.to_double(tag.value) for tag in self.snk.tags()
+                if pmt.symbol_to_string(tag.key) == key]
+
+    def test_001_noise(self):
+        block = self.run_block(self.noise(1))
+        self.assertEqual(block.get_event_count(), 0)
+        self.assertEqual(len(self.snk.tags()), 0)
+
+    def test_002_impulse(self):
+        inn = self.noise(2)
+        iimpulse = 20*VLEN + 100
+        inn[iimpulse] = 30.
+        block = self.run_block(inn)
+        self.assertEqual(block.get_event_count(), 1)
+        # the capture is centered on the impulse
+        self.assertEqual(np.argmax(np.abs(block.vevent)), VLEN//2)
+        self.assertAlmostEqual(self.tag_values('PEAK')[0], 30., 4)
+        self.assertTrue(self.tag_values('KURTOSIS')[0] > 2.)
+
+    def test_003_chirp(self):
+        inn = self.noise(3)
+        # a constant amplitude chirp, one window long, 5 times the noise
+        t = np.arange(WINDOW)
+        ichirp = 12*VLEN + 3*WINDOW
+        inn[ichirp:ichirp+WINDOW] += 5.*np.exp(1j*np.pi*0.001*t*t)
+        block = self.run_block(inn)
+        self.assertEqual(block.get_event_count(), 1)
+        kurtosis = self.tag_values('KURTOSIS')
+        # a constant amplitude has kurtosis near 1, below noise
+        self.assertEqual(len(kurtosis), 1)
+        self.assertTrue(kurtosis[0] < 2.)
+
+if __name__ == '__main__':
+    gr_unittest.run(qa_ra_kevent, "qa_ra_kevent.xml")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2019 Quiet Skies LLC
+#
+# This is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+# History
+# 19MAR15 GIL run in a flow graph, not with stand in modules
+# 19MAR14 GIL initial version, transient, carrier and noise only spectra
+
+import numpy as np
+from gnuradio import gr, gr_unittest
+from gnuradio import blocks
+from ra_spectral_event import ra_spectral_event, EVENT_CHANNEL, \
+    EVENT_SECOND, EVENT_FRACTION, EVENT_SNR, EVENT_LEN
+
+VLEN = 256
+NAVERAGE = 100
+NSIGMA = 6.
+SAMPLE_RATE = 6.E6
+
+class qa_ra_spectral_event(gr_unittest.TestCase):
+    """
+    qa_ra_spectral_event checks a narrow band transient gives one event
+    record, noise alone gives none, and a carrier that turns on and
+    stays on stops giving events once the channel statistics follow it
+    """
+    def setUp(self):
+        self.tb = gr.top_block()
+
+    def tearDown(self):
+        self.tb = None
+
+    def spectra(self, seed, nv):
+        # averages of 64 noise power spectra, each channel of mean 1
+        rng = np.random.RandomState(seed)
+        return (rng.gamma(64., 1./64., size=(nv, VLEN))).astype(np.float32)
+
+    def run_block(self, block, spectra):
+        src = blocks.vector_source_f(spectra.ravel().tolist(), False, VLEN)
+        self.snk = blocks.vector_sink_f(EVENT_LEN)
+        self.tb.connect(src, block, self.snk)
+        self.tb.run()
+        return np.array(self.snk.data()).reshape(-1, EVENT_LEN)
+
+    def test_001_noise(self):
+        block = ra_spectral_event(VLEN, NSIGMA, SAMPLE_RATE, NAVERAGE, 0.)
+        records = self.run_block(block, self.spectra(1, 1000))
+        self.assertEqual(len(records), 0)
+
+    def test_002_transient(self):
+        block = ra_spectral_event(VLEN, NSIGMA, SAMPLE_RATE, NAVERAGE, 0.)
+        # start hours into the stream, where float32 seconds alone
+        # could not tell adjacent spectra apart
+        nstart = 2**25
+        block.nspectra = nstart
+        spectra = self.spectra(2, 400)
+        spectra[300, 77] += 3.       # 24 sigma
+        spectra[301, 77] += 3.
+        records = self.run_block(block, spectra)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(len(self.snk.tags()), 2)
+        dt = float(VLEN)/SAMPLE_RATE
+        for i in range(2):
+            self.assertEqual(records[i][EVENT_CHANNEL], 77.)
+            self.assertTrue(records[i][EVENT_SNR] > 20.)
+            seconds = (nstart + 300 + i)*dt
+            self.assertEqual(records[i][EVENT_SECOND], np.floor(seconds))
+            self.assertAlmostEqual(records[i][EVENT_FRACTION],
+                                   seconds - np.floor(seconds), 6)
+        self.assertTrue(records[1][EVENT_FRACTION] >
+                        records[0][EVENT_FRACTION])
+
+    def test_003_carrier(self):
+        block = ra_spectral_event(VLEN, NSIGMA, SAMPLE_RATE, NAVERAGE, 0.)
+        spectra = self.spectra(3, 3000)
+        spectra[1000:, 40] += 2.     # 16 sigma, on from spectrum 1000
+        records = self.run_block(block, spectra)
+        channels = records[:, EVENT_CHANNEL]
+        self.assertTrue(len(records) > 0)
+        # the channel statistics follow the new level within
+        # a few averaging times, not every spectrum to the end
+        self.assertTrue(np.all(channels == 40.))
+        self.assertTrue(len(records) < 1000)
+
+if __name__ == '__main__':
+    gr_unittest.run(qa_ra_spectral_event, "qa_ra_spectral_event.xml")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2019 Quiet Skies LLC
+#
+# This is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+# History
+# 19MAR15 GIL run both blocks in a flow graph, not with stand in modules
+# 19MAR14 GIL initial version, compare work() with the per sample loop
+
+import numpy as np
+from gnuradio import gr, gr_unittest
+from gnuradio import blocks
+import pmt
+from ra_vevent import ra_vevent, ESTIMATE_MEAN, ESTIMATE_MEDIAN, \
+    ESTIMATE_MAD
+
+EVENT_MONITOR = 1
+
+class ref_vevent(gr.decim_block):
+    """
+    ref_vevent is the original per sample ra_vevent work() loop, kept
+    as the reference for the vectorized block.  Event times are left out.
+    """
+    def __init__(self, vlen, mode, nsigma):
+        gr.decim_block.__init__(self, name="ref_vevent",
+                                in_sig=[np.complex64],
+                                out_sig=[(np.complex64, int(vlen))],
+                                decim=int(vlen))
+        self.vlen = vlen
+        self.vlen2 = int(vlen/2)
+        self.next = 0
+        self.next2 = self.vlen2 + 1
+        self.oneovern = 1./float(vlen)
+        self.waitcount = vlen
+        self.mode = mode
+        self.nsigma2 = nsigma*nsigma
+        self.values = np.zeros(vlen, dtype=np.complex64)
+        self.value2s = np.zeros(vlen)
+        self.vevent = np.zeros(vlen, dtype=np.complex64)
+        self.full = False
+        self.rmssum2 = 0.
+        self.rms2 = 0.
+        self.nsigmarms2 = 0.
+        self.nevents = 0
+
+    def select_event(self):
+        if self.next2 == self.vlen2:
+            self.vevent = self.values.copy()
+            return
+        shift = self.vlen2 - self.next2
+        if shift < 0:
+            length = self.vlen + shift
+            self.vevent[(self.vlen+shift):self.vlen] = self.values[0:-shift]
+            self.vevent[0:length] = self.values[-shift:self.vlen]
+        else:
+            length = self.vlen - shift
+            self.vevent[0:shift] = self.values[length:self.vlen]
+            self.vevent[shift:self.vlen] = self.values[0:length]
+
+    def tag_event(self):
+        offset = self.nitems_written(0) + 1
+        self.add_item_tag(0, offset, pmt.intern('PEAK'),
+                          pmt.from_double(np.sqrt(self.value2s[self.next2])))
+        self.add_item_tag(0, offset, pmt.intern('RMS'),
+                          pmt.from_double(np.sqrt(self.rms2)))
+        self.nevents = self.nevents + 1
+
+    def work(self, input_items, output_items):
+        inn = input_items[0]
+        outa = output_items[0]
+        mag2 = inn.real*inn.real + inn.imag*inn.imag
+        nout = 0
+        if self.full:
+            for j in range(len(inn)):
+                self.values[self.next] = inn[j]
+                self.value2s[self.next] = mag2[j]
+                self.rmssum2 = self.rmssum2 + mag2[j]
+                self.next = self.next + 1
+                self.next2 = self.next2 + 1
+                if self.next2 >= self.vlen:
+                    self.next2 = 0
+                if self.next >= self.vlen:
+                    self.next = 0
+                    self.rms2 = self.rmssum2*self.oneovern
+                    self.nsigmarms2 = self.nsigma2*self.rms2
+                    self.rmssum2 = 0.
+                    if self.mode <= EVENT_MONITOR:
+                        self.vevent = self.values.copy()
+                    outa[nout] = self.vevent
+                    nout = nout + 1
+                if self.value2s[self.next2] > self.nsigmarms2:
+                    if self.full:
+                        self.select_event()
+                        self.tag_event()
+                        self.waitcount = self.vlen
+                        self.full = False
+        else:
+            for j in range(len(inn)):
+                self.values[self.next] = inn[j]
+                self.value2s[self.next] = mag2[j]
+                self.rmssum2 = self.rmssum2 + mag2[j]
+                self.next = self.next + 1
+                if self.next >= self.vlen:
+                    self.full = True
+                    self.next = 0
+                    self.rms2 = self.rmssum2*self.oneovern
+                    self.nsigmarms2 = self.nsigma2*self.rms2
+                    self.rmssum2 = 0.
+                    outa[nout] = self.vevent
+                    nout = nout + 1
+                if self.waitcount <= 0:
+                    self.full = True
+                else:
+                    self.waitcount = self.waitcount - 1
+                self.next2 = self.next2 + 1
+                if self.next2 >= self.vlen:
+                    self.next2 = 0
+        return nout
+
+def tag_list(snk, keys):
+    """
+    tag_list() returns the (offset, key, value) of the sink tags with keys
+    """
+    tags = []
+    for tag in snk.tags():
+        key = pmt.symbol_to_string(tag.key)
+        if key in keys:
+            tags.append((tag.offset, key, pmt.to_double(tag.value)))
+    return sorted(tags)
+
+class qa_ra_vevent(gr_unittest.TestCase):
+    """
+    qa_ra_vevent runs ra_vevent in a flow graph on random streams with
+    impulses and checks its outputs and tags match the per sample loop
+    """
+    def setUp(self):
+        self.tb = gr.top_block()
+
+    def tearDown(self):
+        self.tb = None
+
+    def noise(self, rng, ns):
+        return (rng.normal(size=ns) + 1j*rng.normal(size=ns)).astype(
+            np.complex64)
+
+    def run_both(self, rng, vlen, mode, nsigma, nv):
+        inn = self.noise(rng, nv*vlen)
+        inn[rng.randint(0, nv*vlen, nv//2)] *= 20.
+        src = blocks.vector_source_c(inn.tolist())
+        block = ra_vevent(vlen, mode, nsigma, 1.E6, 0.)
+        ref = ref_vevent(vlen, mode, nsigma)
+        snk = blocks.vector_sink_c(vlen)
+        refsnk = blocks.vector_sink_c(vlen)
+        dbg = blocks.message_debug()
+        self.tb.connect(src, block, snk)
+        self.tb.connect(src, ref, refsnk)
+        self.tb.msg_connect(block, 'events', dbg, 'store')
+        # one vector per call for both blocks, so their calls match
+        self.tb.run(1)
+        self.assertEqual(len(snk.data()), nv*vlen)
+        self.assertTrue(np.array_equal(np.array(snk.data()),
+                                       np.array(refsnk.data())))
+        tags = tag_list(snk, ('PEAK', 'RMS'))
+        reftags = tag_list(refsnk, ('PEAK', 'RMS'))
+        self.assertEqual(len(tags), len(reftags))
+        for tag, reftag in zip(tags, reftags):
+            self.assertEqual(tag[0:2], reftag[0:2])
+            self.assertAlmostEqual(tag[2]/reftag[2], 1., 5)
+        self.assertEqual(dbg.num_messages(), ref.nevents)
+        return ref.nevents
+
+    def test_001_random(self):
+        rng = np.random.RandomState(1)
+        nevents = 0
+        for irun in range(20):
+            self.tb = gr.top_block()
+            vlen = rng.randint(16, 200)
+            mode = rng.randint(1, 3)
+            nsigma = rng.uniform(2., 5.)
+            nevents = nevents + self.run_both(rng, vlen, mode, nsigma, 24)
+        # the comparison must include events
+        self.assertTrue(nevents > 10)
+
+    def test_002_impulse(self):
+        vlen = 256
+        rng = np.random.RandomState(2)
+        inn = self.noise(rng, 8*vlen)
+        inn[5*vlen + 17] = 40.
+        src = blocks.vector_source_c(inn.tolist())
+        block = ra_vevent(vlen, 2, 5., 1.E6, 0.)
+        snk = blocks.vector_sink_c(vlen)
+        self.tb.connect(src, block, snk)
+        # events are found only once a call starts with the buffer full
+        self.tb.run(1)
+        peaks = tag_list(snk, ('PEAK',))
+        self.assertEqual(len(peaks), 1)
+        self.assertAlmostEqual(peaks[0][2], 40., 3)
+        # the event is centered in the output vectors after it
+        self.assertEqual(np.argmax(np.abs(block.vevent)), vlen//2)
+        self.assertEqual(block.ecount, 1)
+
+    def test_003_pdu(self):
+        vlen = 256
+        rng = np.random.RandomState(3)
+        inn = self.noise(rng, 8*vlen)
+        inn[4*vlen + 100] = 30.
+        src = blocks.vector_source_c(inn.tolist())
+        block = ra_vevent(vlen, 2, 5., 1.E6, 0.)
+        snk = blocks.vector_sink_c(vlen)
+        dbg = blocks.message_debug()
+        self.tb.connect(src, block, snk)
+        self.tb.msg_connect(block, 'events', dbg, 'store')
+        self.tb.run(1)
+        self.assertEqual(dbg.num_messages(), 1)
+        msg = dbg.get_message(0)
+        meta = pmt.car(msg)
+        for key in ('MJD', 'PEAK', 'RMS'):
+            self.assertTrue(pmt.dict_has_key(meta, pmt.intern(key)))
+        # the PDU carries the values of the tags
+        tags = dict((key, value) for (offset, key, value)
+                    in tag_list(snk, ('PEAK', 'RMS')))
+        for key in ('PEAK', 'RMS'):
+            value = pmt.to_double(pmt.dict_ref(meta, pmt.intern(key),
+                                               pmt.PMT_NIL))
+            self.assertAlmostEqual(value, tags[key], 5)
+        self.assertAlmostEqual(tags['PEAK'], 30., 4)
+        # and the samples of the event, centered on the impulse
+        samples = np.array(pmt.c32vector_elements(pmt.cdr(msg)))
+        self.assertEqual(len(samples), vlen)
+        self.assertEqual(samples[vlen//2], 30.)
+        self.assertTrue(np.array_equal(samples, block.vevent))
+        self.assertTrue(np.array_equal(samples,
+                                       np.array(snk.data()[-vlen:])))
+
+    def test_004_estimators(self):
+        # noise of mean |x|^2 2, with a burst of RFI over 5% of the buffer
+        vlen = 1024
+        rng = np.random.RandomState(4)
+        value2s = np.abs(self.noise(rng, vlen))**2
+        value2s[500:551] += 64.
+        rms2s = []
+        for estimator in (ESTIMATE_MEAN, ESTIMATE_MEDIAN, ESTIMATE_MAD):
+            block = ra_vevent(vlen, 2, 5., 1.E6, 0., estimator)
+            block.value2s[:] = value2s
+            block.rmssum2 = np.sum(value2s)
+            rms2s.append(block.estimate_rms2())
+        # the burst inflates the mean, not the median or the MAD
+        self.assertTrue(rms2s[ESTIMATE_MEAN] > 4.5)
+        for estimator in (ESTIMATE_MEDIAN, ESTIMATE_MAD):
+            self.assertTrue(1.5 < rms2s[estimator] < 3.)
+
+    def test_005_after_burst(self):
+        # an impulse just after a burst of RFI over 5% of a buffer is
+        # missed with the mean, but found with the median or the MAD
+        vlen = 256
+        rng = np.random.RandomState(5)
+        inn = self.noise(rng, 10*vlen)
+        inn[5*vlen:5*vlen + 13] += 7.
+        inn[6*vlen + 20] = 14.
+        npeaks = []
+        for estimator in (ESTIMATE_MEAN, ESTIMATE_MEDIAN, ESTIMATE_MAD):
+            self.tb = gr.top_block()
+            src = blocks.vector_source_c(inn.tolist())
+            block = ra_vevent(vlen, 2, 8., 1.E6, 0., estimator)
+            snk = blocks.vector_sink_c(vlen)
+            self.tb.connect(src, block, snk)
+            self.tb.run(1)
+            peaks = tag_list(snk, ('PEAK',))
+            npeaks.append(len(peaks))
+            if len(peaks) > 0:
+                self.assertAlmostEqual(peaks[0][2], 14., 4)
+        self.assertEqual(npeaks, [0, 1, 1])
+
+if __name__ == '__main__':
+    gr_unittest.run(qa_ra_vevent, "qa_ra_vevent.xml")
@@ -157,6 +157,9 @@ class ra_event_log(gr.sync_block):
                 elif key == 'RMS':
                     self.erms = value
 #                    print 'Tag RMs : %7.4f' % (self.erms)
+                elif key in ('PEAKINDEX', 'WIDTH', 'FLUENCE', 'START',
+                             'STOP', 'BOXCAR', 'TIER', 'KURTOSIS'):
+                    pass       # known, but not used here
                 else:
                     print 'Unknown Tag: ', value
 
@@ -0,0 +1,211 @@
+"""
+Kurtosis Event Detection, outputting a time sequence vector, centered on the event
+"""
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2019 Quiet Skies LLC
+#
+# This is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+# History
+# 19MAR04 GIL initial version, trigger on kurtosis rather than power
+
+import datetime
+import numpy as np
+from gnuradio import gr
+import pmt
+
+try:
+    import jdutil
+except:
+    print "jdutil is needed to compute Modified Julian Days"
+    print "try:"
+    print "git clone https://github.com/jiffyclub/jdutil.py"
+    print ""
+    print "Good Luck! -- Glen"
+
+class ra_kevent(gr.decim_block):
+    """
+    Kurtosis Event Capture in a data stream.  The stream is cut into
+    windows and the kurtosis of each window, <|x|^4>/<|x|^2>^2, is
+    compared with 2, its value for Gaussian noise.  Bursts that are not
+    noise like, such as radar chirps (kurtosis below 2) or impulses
+    (above 2), are found even when they add little power.
+    Input:
+    1: Stream of complex (I/Q) samples
+    Parameters
+    1: vector length - number of complex samples to save
+    2: window - samples in each kurtosis estimate
+    3: nsigma - Number of Sigma of kurtosis excess to declare an event
+    4: sample-rate - Hz
+    5: sample delay (seconds), time until sample arrives at block
+    Output:
+    1: Vector of complex samples - centered on the latest event
+    The output is tagged with the event MJD, PEAK, RMS and KURTOSIS
+    """
+    def __init__(self, vlen, window, nsigma, sample_rate, sample_delay):
+        """
+        Initialize the event class, zero sample buffer
+        """
+        gr.decim_block.__init__(self, name="ra_kevent",
+                                # input I/Q pairs
+                                in_sig=[np.complex64],
+                                # output vector of samples
+                                out_sig=[(np.complex64, int(vlen))],
+                                decim=int(vlen))
+        self.vlen = int(vlen)
+        if self.vlen < 16:
+            print "ra_kevent: vector length too short:", self.vlen
+            exit()
+        self.vlen2 = int(self.vlen/2)
+        self.set_relative_rate(1./np.float(self.vlen))
+        self.set_tag_propagation_policy(gr.TPP_ALL_TO_ALL)
+        self.sample_rate = 1.E6
+        self.nsigma = 5.
+        self.window = 256
+        self.delay = 0.
+        self.datetime_delay = datetime.timedelta(seconds=self.delay)
+        # vector of last event found
+        self.vevent = np.zeros(self.vlen, dtype=np.complex64)
+        self.ecount = 0                # count of events detected so far
+        self.set_sample_rate(sample_rate)
+        self.set_sample_delay(sample_delay)
+        self.set_window(window)
+        self.set_nsigma(nsigma)
+
+    def init_buffer(self):
+        """
+        Initialize the sample buffer.  Half a vector of samples is kept
+        before the next window to center the output on an event.
+        """
+        self.samples = np.zeros(self.vlen2, dtype=np.complex64)
+        self.next = self.vlen2         # where the next window starts
+
+    def set_window(self, window):
+        """
+        Set the number of samples in each kurtosis estimate
+        """
+        window = int(window)
+        if window < 16:
+            print "Invalid Kurtosis Window: ", window
+            window = 16
+        self.window = window
+        # kurtosis of noise and its rms, for window samples
+        self.knoise = 2.*float(self.window - 1)/float(self.window)
+        self.krms = 2./np.sqrt(float(self.window))
+        self.init_buffer()
+        print "Using Kurtosis Window: ", self.window
+
+    def set_nsigma(self, nsigma):
+        """
+        Set the Sigma detection threshold level
+        """
+        nsigma = float(nsigma)
+        if nsigma < 0.1:
+            print "Invalid Nsigma value: ", nsigma
+            nsigma = 5.
+        self.nsigma = nsigma
+        print "Using   Nsigma value: ", self.nsigma
+
+    def set_sample_rate(self, sample_rate):
+        sample_rate = float(sample_rate)
+        if sample_rate < 100.:
+            print "Invalid Sample Rate: ", sample_rate
+            sample_rate = 1.E6
+        self.sample_rate = sample_rate
+        print "Using    Sample Rate: ", self.sample_rate
+
+    def set_sample_delay(self, sample_delay):
+        self.delay = float(sample_delay)
+        self.datetime_delay = datetime.timedelta(seconds=self.delay)
+        print "Using   Sample Delay: ", self.datetime_delay
+
+    def get_event_count(self):
+        """
+        Return the count of events so far detected
+        """
+        return self.ecount
+
+    def forecast(self, noutput_items, ninput_items):
+        """
+        forecast the number of spectra required to get an output
+        """
+        if noutput_items is None:
+            ninput_items[0] = self.vlen
+        else:
+            for i in range(len(noutput_items)):
+                ninput_items[i] = noutput_items[i]*self.vlen
+        return ninput_items
+
+    def work(self, input_items, output_items):
+        """
+        Work computes the kurtosis of all complete windows at once and
+        outputs the capture of the strongest event in each output vector
+        """
+        inn = input_items[0]    # input complex samples
+        outa = output_items[0]  # all outputs in PORT 0; vector of samples
+        nout = len(outa)
+        if nout < 1:
+            return 0
+        first = len(self.samples)             # where this input starts
+        self.samples = np.concatenate((self.samples, inn))
+        ns = len(self.samples)
+
+        # windows need half a vector after them to center the capture
+        nwindow = (ns - self.vlen2 - self.next) // self.window
+        end = self.next + (nwindow*self.window)
+        mag2 = self.samples[self.next:end]
+        mag2 = (mag2.real*mag2.real + mag2.imag*mag2.imag).reshape(
+            nwindow, self.window)
+        m2 = mag2.mean(axis=1)                # second moment of each window
+        m4 = (mag2*mag2).mean(axis=1)         # fourth moment
+        kurtosis = np.where(m2 > 0., m4/np.maximum(m2*m2, 1.E-30),
+                            self.knoise)
+        excess = np.abs(kurtosis - self.knoise)/self.krms
+        hits = np.nonzero(excess > self.nsigma)[0]
+
+        # one event per output vector, the one of highest excess
+        centers = self.next + (hits*self.window) + (self.window//2)
+        iouts = np.clip((centers - first)//self.vlen, 0, nout - 1)
+        now = datetime.datetime.utcnow() - self.datetime_delay
+        nowmjd = np.float(jdutil.datetime_to_mjd(now))
+        outa[:] = self.vevent                 # hold the last event
+        for iout in np.unique(iouts):
+            ihits = hits[iouts == iout]
+            ihit = ihits[np.argmax(excess[ihits])]
+            # center the capture on the peak in the window
+            center = self.next + (ihit*self.window) + np.argmax(mag2[ihit])
+            self.vevent = self.samples[center - self.vlen2:
+                                       center - self.vlen2 + self.vlen].copy()
+            eventmjd = nowmjd - (float(ns - center)/self.sample_rate/86400.)
+            emagnitude = np.sqrt(mag2[ihit].max())
+            erms = np.sqrt(m2[ihit])
+            offset = self.nitems_written(0) + int(iout)
+            for key, value in (('MJD', eventmjd), ('PEAK', emagnitude),
+                               ('RMS', erms),
+                               ('KURTOSIS', kurtosis[ihit])):
+                self.add_item_tag(0, offset, pmt.to_pmt(key),
+                                  pmt.to_pmt(float(value)),
+                                  pmt.to_pmt('event'))
+            outa[iout:] = self.vevent
+            self.ecount = self.ecount + 1
+
+        # keep half a vector before the next window
+        self.samples = self.samples[end - self.vlen2:]
+        self.next = self.vlen2
+        return nout
+    # end ra_kevent work()
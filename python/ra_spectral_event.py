@@ -0,0 +1,245 @@
+"""
+Spectral Event Detection, finding narrow band transients in power spectra
+"""
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2019 Quiet Skies LLC
+#
+# This is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; see the file COPYING.  If not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street,
+# Boston, MA 02110-1301, USA.
+#
+# History
+# 19MAR02 GIL initial version, channel statistics kept as numpy vectors
+# 19MAR12 GIL clip events into the statistics, time as seconds and fraction
+
+import datetime
+import numpy as np
+from gnuradio import gr
+import pmt
+
+try:
+    import jdutil
+except:
+    print "jdutil is needed to compute Modified Julian Days"
+    print "try:"
+    print "git clone https://github.com/jiffyclub/jdutil.py"
+    print ""
+    print "Good Luck! -- Glen"
+
+# values in each output event record
+EVENT_CHANNEL = 0
+EVENT_SECOND = 1               # whole seconds since start
+EVENT_FRACTION = 2             # and the fraction of a second
+EVENT_SNR = 3
+EVENT_LEN = 4
+
+class ra_spectral_event(gr.basic_block):
+    """
+    Spectral Event Detection.  Narrow band transients are found in a
+    stream of power spectra, such as the output of an FFT followed by
+    complex to magnitude squared.  Each channel keeps a running mean and
+    variance; a channel in one spectrum is an event if its power exceeds
+    the mean by N sigma.
+    Input:
+    1: Vector of power spectra (float)
+    Parameters
+    1: vector length - number of channels in each spectrum
+    2: nsigma - Number of Sigma required to declare an event
+    3: sample-rate - Hz, of the I/Q samples going into the FFT
+    4: naverage - spectra in the running mean and variance
+    5: sample delay (seconds), time until sample arrives at block
+    Output:
+    1: Event records, 4 floats: channel, time since start as whole
+       seconds and fraction of a second, and signal to noise ratio.
+       One record for each channel in each spectrum above threshold.
+    Each record is tagged with the event MJD
+    """
+    def __init__(self, vlen, nsigma, sample_rate, naverage, sample_delay):
+        """
+        Initialize the channel statistics
+        """
+        gr.basic_block.__init__(self, name="ra_spectral_event",
+                                # input power spectra
+                                in_sig=[(np.float32, int(vlen))],
+                                # output event records
+                                out_sig=[(np.float32, EVENT_LEN)])
+        self.vlen = int(vlen)
+        self.nsigma = 5.
+        self.sample_rate = 1.E6
+        self.naverage = 100
+        self.delay = 0.
+        self.datetime_delay = datetime.timedelta(seconds=self.delay)
+        self.nspectra = 0              # spectra processed so far
+        self.ecount = 0                # events detected so far
+        self.ndropped = 0              # events with no room for output
+        self.set_vlen(vlen)
+        self.set_nsigma(nsigma)
+        self.set_sample_rate(sample_rate)
+        self.set_naverage(naverage)
+        self.set_sample_delay(sample_delay)
+
+    def init_stats(self):
+        """
+        Zero the channel statistics, restarting the running averages
+        """
+        self.mean = np.zeros(self.vlen)          # running mean of power
+        self.mean2 = np.zeros(self.vlen)         # and of power squared
+        self.oneoversigma = np.zeros(self.vlen)  # 1/rms in each channel
+        self.count = 0                           # spectra in the averages
+
+    def set_vlen(self, vlen):
+        vlen = int(vlen)
+        if vlen < 1:
+            print "Invalid Vector Length: ", vlen
+            vlen = 1
+        self.vlen = vlen
+        self.dt = float(self.vlen)/self.sample_rate
+        self.init_stats()
+        print "Using  Vector Length: ", self.vlen
+
+    def set_nsigma(self, nsigma):
+        """
+        Set the Sigma detection threshold level
+        """
+        nsigma = float(nsigma)
+        if nsigma < 0.1:
+            print "Invalid Nsigma value: ", nsigma
+            nsigma = 5.
+        self.nsigma = nsigma
+        print "Using   Nsigma value: ", self.nsigma
+
+    def set_sample_rate(self, sample_rate):
+        """
+        Set the I/Q sample rate, giving the time between spectra
+        """
+        sample_rate = float(sample_rate)
+        if sample_rate < 100.:
+            print "Invalid Sample Rate: ", sample_rate
+            sample_rate = 1.E6
+        self.sample_rate = sample_rate
+        self.dt = float(self.vlen)/self.sample_rate
+        print "Using    Sample Rate: ", self.sample_rate
+
+    def set_naverage(self, naverage):
+        """
+        Set the number of spectra in the running mean and variance.
+        No events are found until naverage spectra are averaged.
+        """
+        naverage = int(naverage)
+        if naverage < 2:
+            print "Invalid N Average: ", naverage
+            naverage = 2
+        self.naverage = naverage
+        self.alpha = 1./float(self.naverage)
+        print "Using      N Average: ", self.naverage
+
+    def set_sample_delay(self, sample_delay):
+        self.delay = float(sample_delay)
+        self.datetime_delay = datetime.timedelta(seconds=self.delay)
+        print "Using   Sample Delay: ", self.datetime_delay
+
+    def get_event_count(self):
+        """
+        Return the count of events so far detected
+        """
+        return self.ecount
+
+    def update_stats(self, spectra, hits):
+        """
+        update_stats() folds a block of spectra into the running channel
+        averages.  Channels with events are clipped to the threshold, so
+        transients barely raise the noise estimate, while a lasting
+        change of level is still followed.
+        """
+        n = len(spectra)
+        if n < 1:
+            return
+        if hits is not None:
+            # hits only occur where oneoversigma > 0
+            sigma = 1./np.where(self.oneoversigma > 0., self.oneoversigma, 1.)
+            spectra = np.where(hits, self.mean + (self.nsigma*sigma), spectra)
+        if self.count < self.naverage:  # still filling, plain average
+            weight = float(n)/float(self.count + n)
+        else:                           # n steps of an exponential average
+            weight = 1. - (1. - self.alpha)**n
+        self.mean += weight*(spectra.mean(axis=0) - self.mean)
+        self.mean2 += weight*((spectra*spectra).mean(axis=0) - self.mean2)
+        self.count = self.count + n
+        var = self.mean2 - self.mean*self.mean
+        # channels with no variance (ie no signal) never trigger
+        self.oneoversigma = np.where(var > 0., 1./np.sqrt(np.abs(var)), 0.)
+
+    def forecast(self, noutput_items, ninput_items):
+        """
+        forecast: events are rare, one spectrum may yield any number
+        """
+        for i in range(len(ninput_items)):
+            ninput_items[i] = 1
+        return ninput_items
+
+    def general_work(self, input_items, output_items):
+        """
+        general_work compares all input spectra with the channel averages
+        and outputs a record for each channel above threshold
+        """
+        spectra = input_items[0]
+        nv = len(spectra)
+        out = output_items[0]
+        nout = 0
+
+        hits = None
+        if self.count >= self.naverage:   # if channel statistics are ready
+            snr = (spectra - self.mean)*self.oneoversigma
+            hits = snr > self.nsigma
+            ispectrum, ichannel = np.nonzero(hits)  # in spectrum order
+            nevents = len(ispectrum)
+            if nevents > len(out):
+                # consume only spectra whose events all fit in the output
+                nv = max(1, ispectrum[len(out)])
+                nkeep = np.searchsorted(ispectrum, nv)
+                if nkeep > len(out):    # one spectrum has too many events
+                    self.ndropped = self.ndropped + nkeep - len(out)
+                    nkeep = len(out)
+                    print "Spectral Events Dropped: ", self.ndropped
+                ispectrum = ispectrum[0:nkeep]
+                ichannel = ichannel[0:nkeep]
+                hits = hits[0:nv]
+            nout = len(ispectrum)
+            if nout > 0:
+                out[0:nout, EVENT_CHANNEL] = ichannel
+                # float32 seconds alone could not resolve spectra after
+                # a few hours, so split off the whole seconds
+                seconds = (self.nspectra + ispectrum)*self.dt
+                out[0:nout, EVENT_SECOND] = np.floor(seconds)
+                out[0:nout, EVENT_FRACTION] = seconds - np.floor(seconds)
+                out[0:nout, EVENT_SNR] = snr[ispectrum, ichannel]
+                # the last input spectrum was computed just now
+                utc = datetime.datetime.utcnow() - self.datetime_delay
+                mjd = np.float(jdutil.datetime_to_mjd(utc))
+                mjds = mjd - ((len(spectra) - 1 - ispectrum)*self.dt/86400.)
+                nwritten = self.nitems_written(0)
+                for i in range(nout):
+                    self.add_item_tag(0, nwritten + i,
+                                      pmt.to_pmt('MJD'),
+                                      pmt.to_pmt(float(mjds[i])),
+                                      pmt.to_pmt('event'))
+                self.ecount = self.ecount + nout
+
+        self.update_stats(spectra[0:nv], hits)
+        self.nspectra = self.nspectra + nv
+        self.consume_each(nv)
+        return nout
+    # end ra_spectral_event general_work()
@@ -23,6 +23,10 @@ Glen Langston (National Science Foundation)
 # Boston, MA 02110-1301, USA.
 #
 # History
+# 19MAR09 GIL no copies or datetimes for each buffer; times from time()
+# 19MAR08 GIL publish each event as a PDU on the events port
+# 19MAR07 GIL add median and MAD noise estimators
+# 19MAR06 GIL vectorize work(), one block of samples at a time
 # 19FEB14 GIL update message header
 # 19JAN22 GIL try to speed up processing
 # 19JAN16 GIL deal with loss of precision in gnuradio companion streams
@@ -33,23 +37,24 @@ Glen Langston (National Science Foundation)
 # 18OCT12 GIL Initial version of event capture
 
 import datetime
+import time
 import numpy as np
 from gnuradio import gr
-import copy
 import pmt
 
-try:
-    import jdutil
-except:
-    print "jdutil is needed to compute Modified Julian Days"
-    print "try:"
-    print "git clone https://github.com/jiffyclub/jdutil.py"
-    print ""
-    print "Good Luck! -- Glen"
-    
 EVENT_MONITOR = 1
 EVENT_DETECT = 2
 
+# noise estimators; for complex noise |x|^2 is exponential, with median
+# ln(2) and median absolute deviation asinh(1/2) times the mean
+ESTIMATE_MEAN = 0
+ESTIMATE_MEDIAN = 1
+ESTIMATE_MAD = 2
+MEDIAN_SCALE = 1./np.log(2.)
+MAD_SCALE = 1./np.arcsinh(0.5)
+MAX_ESTIMATE = 1024            # most samples in a median or MAD
+UNIX_MJD = 40587.              # MJD of the unix time origin, 1970 Jan 1
+
 class ra_vevent(gr.decim_block):
     """
     Event Capture in a data stream.  The Peak magnitude of the outlier and 
@@ -63,12 +68,16 @@ class ra_vevent(gr.decim_block):
     3: nsigma - Number of Sigma required to declare an event
     4: sample-rate - Hz
     5: sample delay (seconds), time until sample arrives at block
+    6: estimator - noise from 0: mean, 1: median or 2: MAD of |x|^2
     Output:
     1: Vector of complex samples - Latest data if no events yet
     The output is tagged with the event MJD, PEAK and RMS
+    events: Message port, one PDU for each event: a dictionary of the
+    MJD, PEAK and RMS, and the complex samples centered on the event
     Glen Langston - National Science Foundation - 2019 Januar 22
     """
-    def __init__(self, vlen, mode, nsigma, sample_rate, sample_delay):
+    def __init__(self, vlen, mode, nsigma, sample_rate, sample_delay,
+                 estimator=ESTIMATE_MEAN):
         """
         Initialize the event class, zero sample buffer
         """
@@ -87,6 +96,7 @@ class ra_vevent(gr.decim_block):
         self.set_tag_propagation_policy(gr.TPP_ALL_TO_ALL)
 #        self.message_port_register_out(pmt.intern('out_port'))
         print 'Registered: Event on output port'
+        self.message_port_register_out(pmt.intern('events'))
 
         self.set_relative_rate(1./np.float(vlen))
         self.vlen2 = int(vlen/2)
@@ -104,6 +114,11 @@ class ra_vevent(gr.decim_block):
         self.full = False
         # vector of last event found
         self.vevent = np.zeros(self.vlen, dtype=np.complex64)
+        # magnitudes^2 in time order, as seen by the search
+        self.seen = np.zeros(2*self.vlen)
+        # magnitudes^2 of the input, grown to the largest call
+        self.mag2 = np.zeros(0, dtype=np.float32)
+        self.imag2 = np.zeros(0, dtype=np.float32)
         self.ecount = np.int_(0)  # count of events detected so far
         self.sample_rate = float(sample_rate)
         if self.sample_rate < 100.:
@@ -119,8 +134,7 @@ class ra_vevent(gr.decim_block):
         self.dt = float(self.vlen2)/self.sample_rate
         self.dutc = datetime.timedelta(seconds=self.dt)
         # initialize event times
-        self.eventutc = datetime.datetime.utcnow() - self.dutc
-        self.eventmjd = np.float(jdutil.datetime_to_mjd(self.eventutc))
+        self.eventmjd = self.now_mjd()
         # !!!!
         # Hack alert! Had to send the MJD in to parts days, including 10ths
         # Plus hours, where days and 10ths of days were subtracted
@@ -128,6 +142,7 @@ class ra_vevent(gr.decim_block):
         self.emagnitude = 0.            # event magnitude
         self.erms = 0.                  # event RMS
         print 'ra_event Vlen, Nsigma, dt: ', self.vlen, self.nsigma, self.dt
+        self.set_estimator(estimator)
         if self.vlen < 16:
             print 'Not Enough samples (<16) to measure RMS: ', self.vlen
             exit()
@@ -160,6 +175,16 @@ class ra_vevent(gr.decim_block):
         return
 
 
+    def now_mjd(self):
+        """
+        now_mjd() returns the MJD of the middle of the buffer: now, less
+        half a buffer and the sample delay.  The system clock in seconds
+        is cheaper than building datetimes for every event.
+        """
+        seconds = time.time() - self.dutc.total_seconds()
+        seconds = seconds - self.datetime_delay.total_seconds()
+        return UNIX_MJD + (seconds/86400.)
+
     def set_mode(self, mode):
         """ 
         Set the event detection mode: One of 
@@ -185,6 +210,39 @@ class ra_vevent(gr.decim_block):
         self.nsigmarms2 = self.nsigma2 * self.rms2
         print "Using   Nsigma value: ", self.nsigma
 
+    def set_estimator(self, estimator):
+        """
+        Set the noise estimator: One of
+        ESTIMATE_MEAN:   mean of |x|^2 over the buffer
+        ESTIMATE_MEDIAN: median of |x|^2, scaled to the mean for noise
+        ESTIMATE_MAD:    median absolute deviation of |x|^2, scaled
+        The median and MAD are not raised by a few strong samples, so
+        the threshold holds through bursts.  They use at most
+        MAX_ESTIMATE samples evenly spaced through the buffer.
+        """
+        estimator = int(estimator)
+        if (estimator < ESTIMATE_MEAN) or (estimator > ESTIMATE_MAD):
+            print "Invalid Estimator value: ", estimator
+            estimator = ESTIMATE_MEAN
+        self.estimator = estimator
+        print "Using Noise Estimator: ", self.estimator
+
+    def estimate_rms2(self):
+        """
+        estimate_rms2() returns the mean of |x|^2 for the noise in the
+        buffer, from the samples in the cycle just ended
+        """
+        if self.estimator == ESTIMATE_MEAN:
+            return self.rmssum2*self.oneovern
+        step = -(-self.vlen // MAX_ESTIMATE)   # round up, n <= MAX_ESTIMATE
+        value2s = self.value2s[::step]
+        n = len(value2s)
+        median = np.partition(value2s, n//2)[n//2]
+        if self.estimator == ESTIMATE_MEDIAN:
+            return median*MEDIAN_SCALE
+        deviations = np.abs(value2s - median)
+        return np.partition(deviations, n//2)[n//2]*MAD_SCALE
+
     def set_sample_rate(self, sample_rate):
         sample_rate = float(sample_rate)
         if sample_rate < 100.:
@@ -229,7 +287,7 @@ class ra_vevent(gr.decim_block):
         iin = self.next2               # event center is at index ie
         iout = self.vlen2              # want event center in middle
         if self.next2 == self.vlen2:   # if data are already in time order
-            self.vevent = copy.deepcopy(self.values)
+            np.copyto(self.vevent, self.values)
             return
         mout = 0
         # first copy from event to end of circular buffer
@@ -257,7 +315,7 @@ class ra_vevent(gr.decim_block):
         vevent: Complex time samples centered on event
         """
         if self.next2 == self.vlen2:   # if data are already in time order
-            self.vevent = copy.deepcopy(self.values)  # just copy and exit
+            np.copyto(self.vevent, self.values)  # just copy and exit
             return
 
         # otherwise the event copy is always done in two parts
@@ -287,148 +345,160 @@ class ra_vevent(gr.decim_block):
                 ninput_items[i] = noutput_items[i]*self.vlen
         return ninput_items
 
+    def write_samples(self, samples, mag2):
+        """
+        write_samples() copies a block of samples into the circular buffer.
+        The block must end at or before the end of the buffer.
+        """
+        n = len(samples)
+        self.values[self.next:self.next+n] = samples
+        self.value2s[self.next:self.next+n] = mag2
+        self.rmssum2 = self.rmssum2 + np.sum(mag2, dtype=np.float64)
+        self.next = self.next + n
+        # next2 is the place to look for the last event
+        self.next2 = (self.next2 + n) % self.vlen
+
+    def end_cycle(self, monitor):
+        """
+        end_cycle() starts the next cycle around the circular buffer,
+        setting the threshold from the rms of the cycle just finished
+        """
+        self.next = 0
+        # only work with squares until event is found
+        self.rms2 = self.estimate_rms2()
+        # set threshold for the next block of samples
+        self.nsigmarms2 = self.nsigma2 * self.rms2
+        self.rmssum2 = 0.   # start new sum
+
+        # if monitoring, output latest vector
+        if monitor and self.mode <= EVENT_MONITOR:
+            np.copyto(self.vevent, self.values)
+            self.emagnitude = np.sqrt(self.value2s.max())
+            self.erms = np.sqrt(self.rms2)
+            self.eventmjd = self.now_mjd()
+            self.ecount = 0
+            self.lastmjd = self.eventmjd
+            self.first_event = True
+
+    def found_event(self):
+        """
+        found_event() captures and tags the event at next2
+        """
+        self.emagnitude = np.sqrt(self.value2s[self.next2])
+        self.erms = np.sqrt(self.rms2)
+        self.eventmjd = self.now_mjd()
+        # deal with circular buffer in centering output event:
+        self.select_event()
+        # describe event to subscribers to the sink vector
+        self.add_item_tag(0,
+                          (self.nitems_written(0)+1),
+                          pmt.to_pmt('MJD'),
+                          pmt.to_pmt(self.eventmjd),
+                          pmt.to_pmt('event'))
+        self.add_item_tag(0,
+                          (self.nitems_written(0)+1),
+                          pmt.to_pmt('PEAK'),
+                          pmt.to_pmt(self.emagnitude),
+                          pmt.to_pmt('event'))
+        self.add_item_tag(0,
+                          (self.nitems_written(0)+1),
+                          pmt.to_pmt('RMS'),
+                          pmt.to_pmt(self.erms),
+                          pmt.to_pmt('event'))
+        self.event_pdu()
+        self.ecount = self.ecount + 1   # keep event count
+        self.first_event = True
+        self.init_buffer()      # start again
+
+    def event_pdu(self):
+        """
+        event_pdu() publishes the event on the events message port, so
+        sinks need not reassemble the event from tags on every vector
+        """
+        meta = pmt.make_dict()
+        meta = pmt.dict_add(meta, pmt.intern('MJD'),
+                            pmt.from_double(self.eventmjd))
+        meta = pmt.dict_add(meta, pmt.intern('PEAK'),
+                            pmt.from_double(float(self.emagnitude)))
+        meta = pmt.dict_add(meta, pmt.intern('RMS'),
+                            pmt.from_double(float(self.erms)))
+        samples = pmt.to_pmt(self.vevent)
+        self.message_port_pub(pmt.intern('events'), pmt.cons(meta, samples))
+
     def work(self, input_items, output_items):
         """
-        Work takes the input data and computes the average peak and RMS
+        Work takes the input data and computes the average peak and RMS.
+        Samples are handled a block at a time, each block ending at the
+        end of the circular buffer or the end of the input.
         """
         inn = input_items[0]    # input complex samples
-        mag2 = inn.real*inn.real + inn.imag*inn.imag  # compute magnitudes^2
-        
+
         # get the number of input samples
         ns = len(inn)           # number of samples in this port
-#        print 'Vevent: ', ns, inn[0], mag2[0]
+
+        # compute magnitudes^2, in place
+        if len(self.mag2) < ns:
+            self.mag2 = np.zeros(ns, dtype=np.float32)
+            self.imag2 = np.zeros(ns, dtype=np.float32)
+        mag2 = self.mag2[0:ns]
+        imag2 = self.imag2[0:ns]
+        np.multiply(inn.real, inn.real, out=mag2)
+        np.multiply(inn.imag, inn.imag, out=imag2)
+        mag2 += imag2
 
         outa = output_items[0]  # all outputs in PORT 0; vector of samples
         nout = 0                # count number of output items
 
-        # this code was optimized to remove some 'ifs' outside the main loop
-        # if the buffer is already full.   The cost is that no event can
-        # be detected until the buffer is full.
-        if self.full:           # if buffer is already full process differently
-            # run through all input samples
-            for j in range(ns):
-                
-                # record the new values (maybe on top of previous
-                self.values[self.next] = inn[j]
-                self.value2s[self.next] = mag2[j]
-                self.rmssum2 = self.rmssum2 + mag2[j]
-
-                # now handle circular buffer and detect full buffer
-                self.next = self.next + 1
-
-                # next2 is the place to look for the last event
-                self.next2 = self.next2 + 1
-                if self.next2 >= self.vlen:
-                    self.next2 = 0
-
-                # determine when buffer is full.
-                # Always output an event each time the buffer cycles
-                # end cycling around the buffer
-                if self.next >= self.vlen:
-                    self.next = 0
-                    # only work with squares until event is found
-                    self.rms2 = self.rmssum2*self.oneovern
-                    # set threshold for the next block of samples
-                    self.nsigmarms2 = self.nsigma2 * self.rms2
-                    self.rmssum2 = 0.   # start new sum
-                    
-                    # if monitoring, output latest vector
-                    if self.mode <= EVENT_MONITOR:
-                        self.vevent = copy.deepcopy(self.values)
-                        self.emagnitude = np.sqrt(max( self.value2s))
-                        self.erms = np.sqrt(self.rms2)
-                        self.eventutc = datetime.datetime.utcnow() - self.dutc
-                        self.eventutc = self.eventutc - self.datetime_delay
-                        self.eventmjd = np.float(jdutil.datetime_to_mjd(self.eventutc))
-                        self.ecount = 0
-                        self.lastmjd = self.eventmjd
-                        self.first_event = True
-                        # Tag the start of the burst (preamble)                                                                    
-
-                    # if time to output and event
-                    outa[nout] = self.vevent    # ouput vector of samples
-                    nout = nout + 1
-
-                # if event found
-                if self.value2s[self.next2] > self.nsigmarms2:
-                    if self.full:       # if still full
-                        # an event is found!
-                        self.emagnitude = np.sqrt(self.value2s[self.next2])
-                        self.erms = np.sqrt(self.rms2)
-                        self.eventutc = datetime.datetime.utcnow()
-                        # offset now for middle of event
-                        self.eventutc = self.eventutc - self.dutc
-                        self.eventutc = self.eventutc - self.datetime_delay
-                        self.eventmjd = np.float(jdutil.datetime_to_mjd(self.eventutc))
-#                        print "Event Detected: %15.9f (MJD) %9.4f %8.4f" % (self.eventmjd, self.emagnitude, self.erms)
-                        # deal with circular buffer in centering output event:
-                        self.select_event()
-                        # describe event to subscribers to the sink vector
-                        self.add_item_tag(0,
-                            (self.nitems_written(0)+1),
-                            pmt.to_pmt('MJD'),
-                            pmt.to_pmt(self.eventmjd),
-                            pmt.to_pmt('event'))
-                        self.add_item_tag(0,
-                                          (self.nitems_written(0)+1),
-                                          pmt.to_pmt('PEAK'),
-                                          pmt.to_pmt(self.emagnitude),
-                                          pmt.to_pmt('event'))
-                        self.add_item_tag(0,
-                                          (self.nitems_written(0)+1),
-                                          pmt.to_pmt('RMS'),
-                                          pmt.to_pmt(self.erms),
-                                          pmt.to_pmt('event'))
-#                        self.event_msg()       # report magnitude, rms and date
-#
-                        self.ecount = self.ecount + 1   # keep event count
-                        self.first_event = True
-#                        print 'Event: ', self.ecount
-#                        print 'Utc event: ', self.eventutc
-#                        print 'Utc MJD  : %12.6f' % (self.eventmjd)
-#                        print 'Utc days : %12.6f + %12.6f' % (fdays, hours)
-#                        print 'Magnitude: ', self.emagnitude, ' +/- ',self.erms
-                        self.init_buffer()      # start again
-                # end if an event found
-            # end for all input samples
-            # end if buffer already full
-        else:  # this is the start of the other major (un-usual) mode
-            # buffer is not full, fill samples in buffer
-            for j in range(ns):
-                
-            # record the new values (maybe on top of previous
-                self.values[self.next] = inn[j]
-                self.value2s[self.next] = mag2[j]
-                self.rmssum2 = self.rmssum2 + mag2[j]
-
-                # now handle circular buffer and detect full buffer
-                self.next = self.next + 1
-                # determine when buffer is full.
-                # Always output an event each time the buffer cycles
-                # end cycling around the buffer
-                if self.next >= self.vlen:
-                    self.full = True
-                    self.next = 0
-                    # only work with squares until event is found
-                    self.rms2 = self.rmssum2*self.oneovern
-                    # set threshold for the next block of samples
-                    self.nsigmarms2 = self.nsigma2 * self.rms2
-                    self.rmssum2 = 0.  # start new sum
-                    
-                    outa[nout] = self.vevent  # ouput vector of samples
-                    nout = nout + 1
-                # check whether we've waited enough for buffer to fill again
-                if self.waitcount <= 0:
+        # Events are searched for only if the buffer is full at the start
+        # of the call, and only one event is found in each call.  The
+        # cost is that no event can be detected until the buffer is full.
+        wasfull = self.full
+        searching = self.full
+        j = 0
+        while j < ns:
+            n = min(self.vlen - self.next, ns - j)
+            wraps = (self.next + n >= self.vlen)
+            if searching:
+                # each new sample is followed by a look at next2, which
+                # trails it by a fixed number of samples.  In time order,
+                # the buffer then the new samples hold all values seen.
+                ahead = (self.next2 - self.next) % self.vlen
+                tail = self.vlen - self.next
+                self.seen[0:tail] = self.value2s[self.next:self.vlen]
+                self.seen[tail:self.vlen] = self.value2s[0:self.next]
+                self.seen[self.vlen:self.vlen+n] = mag2[j:j+n]
+                seen = self.seen[ahead+1:ahead+1+n]
+                # the last sample of a cycle sees the next threshold
+                nsearch = n - 1 if wraps else n
+                hits = np.flatnonzero(seen[0:nsearch] > self.nsigmarms2)
+                if len(hits) > 0:
+                    # an event is found!
+                    i = hits[0] + 1
+                    self.write_samples(inn[j:j+i], mag2[j:j+i])
+                    j = j + i
+                    self.found_event()
+                    searching = False
+                    continue
+            self.write_samples(inn[j:j+n], mag2[j:j+n])
+            j = j + n
+
+            # Always output an event each time the buffer cycles
+            if wraps:
+                self.end_cycle(wasfull)
+                if not wasfull:
                     self.full = True
-                else:
-                    self.waitcount = self.waitcount - 1
-                    
-                # next2 is the place to look for the last event
-                self.next2 = self.next2 + 1
-                if self.next2 >= self.vlen:
-                    self.next2 = 0
-            # end for all samples
-        # end else if not full
+                outa[nout] = self.vevent    # ouput vector of samples
+                nout = nout + 1
+                if searching and seen[n-1] > self.nsigmarms2:
+                    self.found_event()
+                    searching = False
+        # end for all input samples
+
+        # check whether we've waited enough for buffer to fill again
+        if not wasfull:
+            if self.waitcount < ns:
+                self.full = True
+            self.waitcount = max(self.waitcount - ns, 0)
 
         if nout > 0:
             output_items[0] = outa